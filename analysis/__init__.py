@@ -2,4 +2,6 @@
 #
 from isofit import *
 
-__all__ = ['isofit']
+__all__ = ['isofit', 'cmdfit', 'coeval', 'crossfit', 'survey', 'cache',
+           'fitcontext', 'montecarlo',
+           'distributed', 'hrtable']
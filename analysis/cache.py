@@ -0,0 +1,195 @@
+#
+#
+import os
+import pickle
+import hashlib
+
+__all__ = ['ResultCache', 'systemInputs', 'isochroneFingerprint']
+
+# attributes of stellar systems that are not observational inputs
+skip_attributes = ['properties', 'pdict', 'name']
+
+
+def systemInputs(system, parent = None):
+    """ Nested tuple of the observational inputs of a star or system
+
+        Every attribute holding a number, string, tuple or list is kept,
+        and component stars (or sub-systems) are described recursively, so
+        that changing any value or uncertainty changes the result.
+    """
+    inputs = []
+    for name in sorted(vars(system)):
+        value = getattr(system, name)
+        if name in skip_attributes:
+            continue
+        if isinstance(value, (list, tuple)) and any(hasattr(v, '__dict__') for v in value):
+            # single stars list themselves as their only component
+            value = tuple(systemInputs(v, system) for v in value
+                          if v is not system and v is not parent)
+            if len(value) == 0:
+                continue
+        elif hasattr(value, '__dict__'):
+            value = systemInputs(value, system)
+        elif isinstance(value, list):
+            value = tuple(value)
+        inputs.append((name, value))
+    return tuple(inputs)
+
+
+def isochroneFingerprint(isochrone):
+    """ Identity of an isochrone and the files it is read from
+
+        Returns None when the isochrone has no file, as with isochrones
+        generated in memory, so that their results are never cached.
+    """
+    from ..model.readers import binaryPath
+    from ..utils.compress import resolvePath
+
+    path = resolvePath(isochrone.filepath)
+    if path is None:
+        return None
+    files = []
+    for filepath in [path, binaryPath(isochrone.filepath)]:
+        if os.path.isfile(filepath):
+            stat = os.stat(filepath)
+            files.append((filepath, stat.st_size, stat.st_mtime))
+    return (isochrone.brand, isochrone.age, isochrone.Fe_H, isochrone.A_Fe, tuple(files))
+
+
+class ResultCache(object):
+
+    def __init__(self, directory = None, max_size = 100*2**20):
+        """ Disk-backed store of fit results
+
+            Results are pickled to one file per key in the cache directory.
+            The least recently used results are removed whenever the
+            total size of the cache exceeds max_size. Hits and misses are
+            counted so the usefulness of the cache can be checked.
+
+            Optional Arguments:
+            -------------------
+            directory  ::  location of the cache. Defaults to
+                           ~/.dsetools_cache.
+
+            max_size   ::  maximum size of the cache in bytes.
+
+            Returns:
+            --------
+            ResultCache object.
+
+        """
+        if directory is None:
+            directory = os.path.join(os.path.expanduser('~'), '.dsetools_cache')
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        self.directory = directory
+        self.max_size  = max_size
+        self.hits      = 0
+        self.misses    = 0
+
+        # size and last use of every entry
+        self.entries = {}
+        for name in os.listdir(directory):
+            if name.endswith('.pkl'):
+                stat = os.stat(os.path.join(directory, name))
+                self.entries[name[:-4]] = [stat.st_size, stat.st_mtime]
+        self.size = sum(entry[0] for entry in self.entries.values())
+
+
+    def key(self, system, isochrone, *options):
+        """ Hash of a system's inputs, an isochrone, the storage type of
+            isochrone data and fit options
+
+            Returns None if the isochrone cannot be fingerprinted.
+        """
+        from ..model.defs import getStorageDtype
+
+        fingerprint = isochroneFingerprint(isochrone)
+        if fingerprint is None:
+            return None
+        return hashlib.sha1(repr((systemInputs(system), fingerprint, getStorageDtype(),
+                                  options))).hexdigest()
+
+
+    def path(self, key):
+        """ Location of the file holding the result for a key """
+        return os.path.join(self.directory, key + '.pkl')
+
+
+    def contains(self, key):
+        """ Whether a result is stored for a key (not counted as a hit) """
+        return key is not None and key in self.entries
+
+
+    def get(self, key):
+        """ Stored result for a key, or None """
+        if not self.contains(key):
+            self.misses += 1
+            return None
+        try:
+            fin = open(self.path(key), 'rb')
+            result = pickle.load(fin)
+            fin.close()
+        except (IOError, EOFError, pickle.UnpicklingError):
+            self.discard(key)
+            self.misses += 1
+            return None
+
+        os.utime(self.path(key), None)
+        self.entries[key][1] = os.path.getmtime(self.path(key))
+        self.hits += 1
+        return result
+
+
+    def put(self, key, result):
+        """ Store a result, then evict old results if the cache is too large """
+        if key is None:
+            return
+        path = self.path(key)
+        fout = open(path + '.tmp', 'wb')
+        pickle.dump(result, fout, pickle.HIGHEST_PROTOCOL)
+        fout.close()
+        os.rename(path + '.tmp', path)
+
+        if key in self.entries:
+            self.size -= self.entries[key][0]
+        stat = os.stat(path)
+        self.entries[key] = [stat.st_size, stat.st_mtime]
+        self.size += stat.st_size
+        self.evict()
+
+
+    def discard(self, key):
+        """ Remove the result stored for a key """
+        if key in self.entries:
+            self.size -= self.entries.pop(key)[0]
+        if os.path.isfile(self.path(key)):
+            os.remove(self.path(key))
+
+
+    def evict(self):
+        """ Remove least recently used results until within max_size """
+        if self.size <= self.max_size:
+            return
+        for key in sorted(self.entries, key = lambda k: self.entries[k][1]):
+            if self.size <= self.max_size:
+                break
+            self.discard(key)
+
+
+    def clear(self):
+        """ Remove every stored result """
+        for key in list(self.entries):
+            self.discard(key)
+
+
+    def hitRate(self):
+        """ Fraction of lookups answered from the cache """
+        lookups = self.hits + self.misses
+        return self.hits/float(lookups) if lookups > 0 else 0.
+
+
+    def stats(self):
+        """ Dictionary of cache usage statistics """
+        return {'hits': self.hits, 'misses': self.misses, 'hit_rate': self.hitRate(),
+                'entries': len(self.entries), 'size': self.size}
@@ -0,0 +1,250 @@
+#
+#
+import numpy as np
+
+__all__ = ['polylineDistance', 'cmdLikelihood', 'cmdFit']
+
+def polylineDistance(x, y, sx, sy, px, py, segments = None, max_pairs = 2000000):
+    """ Error-weighted squared distance from points to a polyline
+
+        For each point, the distance to every segment of the polyline is
+        computed in units of that point's uncertainties, and the minimum
+        over all segments is returned. The calculation is vectorized over
+        points and segments, with points processed in chunks so that at
+        most max_pairs point-segment pairs are held in memory at once.
+
+        Required Arguments:
+        -------------------
+        x, y    ::  arrays of point coordinates (e.g., color and magnitude).
+
+        sx, sy  ::  arrays of uncertainties in x and y for each point.
+
+        px, py  ::  arrays of polyline vertices.
+
+        Optional Arguments:
+        -------------------
+        segments   ::  boolean mask selecting which segments to consider.
+
+        max_pairs  ::  maximum number of point-segment pairs per chunk.
+
+        Returns:
+        --------
+        d2      ::  minimum squared distance (in sigma) for each point.
+
+    """
+    ax, ay = px[:-1], py[:-1]
+    bx, by = px[1:],  py[1:]
+    if segments is not None:
+        ax, ay, bx, by = ax[segments], ay[segments], bx[segments], by[segments]
+    d2     = np.empty(len(x))
+    if len(ax) == 0:
+        d2.fill(np.inf)
+        return d2
+
+    chunk  = max(1, max_pairs//max(1, len(ax)))
+    for start in range(0, len(x), chunk):
+        s   = slice(start, start + chunk)
+        wx  = 1.0/sx[s, np.newaxis]
+        wy  = 1.0/sy[s, np.newaxis]
+
+        # segment vectors and point offsets in scaled coordinates
+        dx  = (bx - ax)*wx
+        dy  = (by - ay)*wy
+        qx  = (x[s, np.newaxis] - ax)*wx
+        qy  = (y[s, np.newaxis] - ay)*wy
+
+        # projection onto each segment, clipped to the segment ends
+        seg = dx**2 + dy**2
+        t   = np.where(seg > 0., (qx*dx + qy*dy)/np.where(seg > 0., seg, 1.), 0.)
+        t   = np.clip(t, 0., 1.)
+        d2[s] = np.min((qx - t*dx)**2 + (qy - t*dy)**2, axis = 1)
+    return d2
+
+
+def cmdLikelihood(color, mag, color_err, mag_err, iso_color, iso_mag,
+                  dist_mods, extinctions, extinction_ratio = 3.1, max_chi2 = 25.):
+    """ Log-likelihood of a color-magnitude diagram for a grid of shifts
+
+        The isochrone is shifted by each combination of distance modulus
+        and color excess, and the log-likelihood is the sum over stars of
+        -chi^2/2, where chi^2 is the error-weighted squared distance from
+        each star to the shifted isochrone. Each star's chi^2 is capped at
+        max_chi2 to limit the influence of field stars and outliers.
+
+        Required Arguments:
+        -------------------
+        color, mag          ::  observed colors and apparent magnitudes.
+
+        color_err, mag_err  ::  uncertainties in colors and magnitudes.
+
+        iso_color, iso_mag  ::  isochrone colors and absolute magnitudes.
+
+        dist_mods           ::  array of distance moduli to consider.
+
+        extinctions         ::  array of color excesses to consider.
+
+        Optional Arguments:
+        -------------------
+        extinction_ratio    ::  ratio of magnitude extinction to color excess.
+
+        max_chi2            ::  maximum chi^2 contributed by a single star.
+
+        Returns:
+        --------
+        lnL                 ::  array of log-likelihoods with one row per
+                                distance modulus and one column per excess.
+
+    """
+    lnL = np.empty((len(dist_mods), len(extinctions)))
+
+    # segments further than sqrt(max_chi2) sigma in magnitude from every
+    # star cannot lower any star's capped chi^2 and are skipped
+    reach   = np.sqrt(max_chi2)*np.max(mag_err)
+    seg_min = np.minimum(iso_mag[:-1], iso_mag[1:])
+    seg_max = np.maximum(iso_mag[:-1], iso_mag[1:])
+
+    # shifting the stars rather than the isochrone leaves segments fixed
+    for j, ebv in enumerate(extinctions):
+        for i, mu in enumerate(dist_mods):
+            y  = mag - mu - extinction_ratio*ebv
+            segments = (seg_max >= np.min(y) - reach) & (seg_min <= np.max(y) + reach)
+            d2 = polylineDistance(color - ebv, y, color_err, mag_err, iso_color,
+                                  iso_mag, segments = segments)
+            lnL[i, j] = -0.5*np.sum(np.minimum(d2, max_chi2))
+    return lnL
+
+
+def cmdFit(color, mag, color_err, mag_err, isochrone_brand,
+           bands = ('Mv', 'Mi', 'Mv'), dist_mods = np.arange(0., 15.01, 0.1),
+           extinctions = np.arange(0., 0.51, 0.05), extinction_ratio = 3.1,
+           max_chi2 = 25., n_coarse = 500, bc_system = None, return_all = False,
+           callback = None):
+    """ Fit a color-magnitude diagram of cluster members against a model set
+
+        Every isochrone in the model grid is compared to the observed
+        color-magnitude diagram using an error-weighted distance-to-curve
+        likelihood. Distance modulus and color excess are treated as free
+        parameters and are scanned for every isochrone; the best pair is
+        reported for each.
+
+        Required Arguments:
+        -------------------
+        color, mag          ::  observed colors and apparent magnitudes.
+
+        color_err, mag_err  ::  uncertainties in colors and magnitudes.
+
+        isochrone_brand     ::  string of the particular model set.
+
+        Optional Arguments:
+        -------------------
+        bands               ::  isochrone magnitude columns (blue, red, mag)
+                                where color = blue - red.
+
+        dist_mods           ::  distance moduli to scan.
+
+        extinctions         ::  color excesses to scan.
+
+        extinction_ratio    ::  ratio of magnitude extinction to color excess.
+
+        max_chi2            ::  maximum chi^2 contributed by a single star.
+
+        n_coarse            ::  number of randomly selected stars used for the
+                                initial scan over distance modulus and color
+                                excess. The full sample is then evaluated in
+                                the neighborhood of the coarse maximum. Set
+                                to None to scan using all stars.
+
+        bc_system           ::  if given, isochrones lacking the requested
+                                bands are transformed using this system.
+
+        return_all          ::  return fit data for every isochrone.
+
+        callback            ::  function receiving progress events (see
+                                utils.progress.Progress).
+
+        Returns:
+        --------
+        fit_data[row]       ::  [age (Myr), [Fe/H], [a/Fe], distance modulus,
+                                 color excess, log-likelihood] for the best
+                                fit isochrone.
+
+        row                 ::  (optional) row in fit_data for the best fit.
+
+        fit_data            ::  (optional) fit data for each isochrone.
+
+    """
+    from ..model import isochrone, manifest
+    from ..utils.progress import Progress
+
+    color, mag = np.asarray(color, dtype = float), np.asarray(mag, dtype = float)
+    color_err  = np.asarray(color_err, dtype = float)
+    mag_err    = np.asarray(mag_err, dtype = float)
+    dist_mods, extinctions = np.atleast_1d(dist_mods), np.atleast_1d(extinctions)
+
+    # fixed subsample of stars for the initial scan
+    if n_coarse is not None and n_coarse < len(color):
+        coarse = np.random.RandomState(0).choice(len(color), n_coarse, replace = False)
+    else:
+        coarse = None
+
+    nodes    = manifest.getManifest(isochrone_brand).isochroneNodes()
+    progress = Progress(callback, 'cmdFit', total = len(nodes), rates = {'stars': len(color)})
+    progress.start()
+
+    fit_data = []
+    maximum  = -np.inf
+    row = 0
+    for afe, feh, age in nodes:
+        progress.update()
+        iso = isochrone.Isochrone(age, feh, alpha_enhancement = afe,
+                                  brand = isochrone_brand)
+        if not iso.exists:
+            continue
+        iso.loadIsochrone()
+        if not iso.is_loaded:
+            continue
+        if bc_system is not None and False in [b in iso.column for b in bands]:
+            iso.addColor(system = bc_system)
+        if False in [b in iso.column for b in bands]:
+            continue
+
+        blue, red, band = [iso.isochrone[:, iso.column[b]] for b in bands]
+        valid = np.isfinite(blue) & np.isfinite(red) & np.isfinite(band)
+        if np.sum(valid) < 2:
+            continue
+        iso_color, iso_mag = (blue - red)[valid], band[valid]
+
+        if coarse is None:
+            lnL  = cmdLikelihood(color, mag, color_err, mag_err, iso_color, iso_mag,
+                                 dist_mods, extinctions, extinction_ratio, max_chi2)
+            i, j = np.unravel_index(np.argmax(lnL), lnL.shape)
+            best = (dist_mods[i], extinctions[j], lnL[i, j])
+        else:
+            lnL  = cmdLikelihood(color[coarse], mag[coarse], color_err[coarse],
+                                 mag_err[coarse], iso_color, iso_mag, dist_mods,
+                                 extinctions, extinction_ratio, max_chi2)
+            i, j = np.unravel_index(np.argmax(lnL), lnL.shape)
+
+            # refine with all stars around the coarse maximum
+            mu_near = dist_mods[max(0, i - 1):i + 2]
+            eb_near = extinctions[max(0, j - 1):j + 2]
+            lnL  = cmdLikelihood(color, mag, color_err, mag_err, iso_color, iso_mag,
+                                 mu_near, eb_near, extinction_ratio, max_chi2)
+            i, j = np.unravel_index(np.argmax(lnL), lnL.shape)
+            best = (mu_near[i], eb_near[j], lnL[i, j])
+
+        fit_data.append([age/1.e6, feh, afe, best[0], best[1], best[2]])
+        if best[2] > maximum:
+            maximum = best[2]
+            row = len(fit_data) - 1
+    progress.finish()
+
+    if len(fit_data) == 0:
+        print 'ERROR: No {0} isochrone provides the bands {1}.\n'.format(isochrone_brand,
+                                                                     ', '.join(bands))
+        return None
+
+    if return_all:
+        return row, fit_data
+    else:
+        return fit_data[row]
@@ -0,0 +1,240 @@
+#
+#
+import numpy as np
+
+__all__ = ['Observations', 'systemLogLikelihoods', 'coevalFit', 'compareStorage']
+
+class Observations(object):
+
+    def __init__(self, systems, independent = 'mass', compare_to = []):
+        """ Observed properties of all stars in a list of systems
+
+            Values and uncertainties of every star in every system are packed
+            into arrays with one row per star and one column per compared
+            property, so that a whole sample can be scored against an
+            isochrone with array operations. Properties that were not
+            observed are stored as NaN and do not contribute to the fit.
+
+            Required Arguments:
+            -------------------
+            systems      ::  list of star, binary, or multiple system objects.
+
+            Optional Arguments:
+            -------------------
+            independent  ::  property used to locate stars on an isochrone.
+
+            compare_to   ::  properties compared against the isochrone.
+                             Defaults to Teff, radius, luminosity and log(g).
+
+            Returns:
+            --------
+            Observations object.
+
+        """
+        if len(compare_to) == 0:
+            compare_to = ['teff', 'radius', 'luminosity', 'logg']
+        self.independent = independent
+        self.props = [prop for prop in compare_to if prop != independent]
+        self.N_systems = len(systems)
+
+        stars, system = [], []
+        for k, sys in enumerate(systems):
+            members = sys.stars if sys.N_components > 1 else [sys]
+            stars  += members
+            system += [k]*len(members)
+        self.system = np.array(system)
+
+        self.indep = np.array([star.properties[star.pdict[independent]][0]
+                               for star in stars], dtype = float)
+        self.value = np.array([[star.properties[star.pdict[prop]][0] for prop in self.props]
+                               for star in stars], dtype = float).reshape(len(stars), -1)
+        self.sigma = np.array([[star.properties[star.pdict[prop]][1] for prop in self.props]
+                               for star in stars], dtype = float).reshape(len(stars), -1)
+        self.fe_h  = np.array([star.Fe_H for star in stars], dtype = float)
+
+        # [Fe/H] is compared as Z/X, following isofit.residuals
+        self.zx     = 10.**(self.fe_h[:, 0] - 1.636)
+        self.zx_err = 10.**(self.fe_h[:, 0] + self.fe_h[:, 1] - 1.636) - self.zx
+
+        # unobserved properties (or zero uncertainties) are excluded
+        with np.errstate(invalid = 'ignore'):
+            self.sigma[~(self.sigma > 0.)]   = np.nan
+            self.zx_err[~(self.zx_err > 0.)] = np.nan
+
+        # normalization of each star's Gaussian likelihood terms
+        self.lnorm = -np.log(np.sqrt(2.*np.pi)*self.sigma)
+
+
+def systemLogLikelihoods(obs, isochrone, lazy = False):
+    """ Log-likelihood of every system in a set of observations
+
+        The isochrone is tabulated once as a function of the independent
+        variable and all stars are interpolated onto it at the same time.
+        A star whose independent variable falls outside the isochrone
+        makes the log-likelihood of its system -inf.
+
+        Required Arguments:
+        -------------------
+        obs        ::  Observations object.
+
+        isochrone  ::  stellar evolution isochrone object (loaded if not
+                       already).
+
+        Optional Arguments:
+        -------------------
+        lazy       ::  load the isochrone without unlogging it or adding
+                       columns, for isochrones the caller does not keep.
+
+        Returns:
+        --------
+        lnL        ::  array of log-likelihoods, one per system.
+
+    """
+    if not isochrone.is_loaded:
+        isochrone.loadIsochrone(lazy = lazy)
+    x     = isochrone.col(obs.independent)
+    order = np.argsort(x)
+    x     = x[order]
+
+    lnL = np.zeros(len(obs.indep))
+    for j, prop in enumerate(obs.props):
+        if not isochrone.hasColumn(prop):
+            continue
+        model = np.interp(obs.indep, x, isochrone.col(prop)[order],
+                          left = np.nan, right = np.nan)
+        term  = obs.lnorm[:, j] - 0.5*((obs.value[:, j] - model)/obs.sigma[:, j])**2
+        observed = np.isfinite(obs.sigma[:, j])
+        lnL[observed] += np.where(np.isnan(term[observed]), -np.inf, term[observed])
+
+    zx_iso = 10.**(isochrone.Fe_H - 1.636)
+    term   = -0.5*((obs.zx - zx_iso)/obs.zx_err)**2
+    lnL   += np.where(np.isfinite(term), term, 0.)
+
+    return np.bincount(obs.system, weights = lnL, minlength = obs.N_systems)
+
+
+def coevalFit(systems, isochrone_brand, fit_using = 'mass', compare_to = [],
+              return_all = False, callback = None):
+    """ Find the best fit isochrone for many systems sharing one age
+
+        All systems are assumed to be coeval and share a common composition.
+        Each isochrone in the model set is loaded once, and the per-system
+        log-likelihoods are computed in a single vectorized pass and summed
+        to give the joint log-likelihood of the isochrone.
+
+        Required Arguments:
+        -------------------
+        systems          ::  list of star, binary, or multiple system objects.
+
+        isochrone_brand  ::  string of the particular model set.
+
+        Optional Arguments:
+        -------------------
+        fit_using        ::  independent variable for fitting data to models.
+
+        compare_to       ::  variables to perform comparison over.
+
+        return_all       ::  return fit data for every isochrone.
+
+        callback         ::  function receiving progress events (see
+                             utils.progress.Progress).
+
+        Returns:
+        --------
+        fit_data[row]    ::  [age (Myr), [Fe/H], [a/Fe], joint log-likelihood,
+                              array of per-system log-likelihoods] for the
+                             best fit isochrone.
+
+        row              ::  (optional) row in fit_data for the best fit.
+
+        fit_data         ::  (optional) fit data for each isochrone.
+
+    """
+    from ..model import isochrone, manifest
+    from ..utils.progress import Progress
+
+    obs = Observations(systems, independent = fit_using, compare_to = compare_to)
+
+    nodes    = manifest.getManifest(isochrone_brand).isochroneNodes()
+    progress = Progress(callback, 'coevalFit', total = len(nodes),
+                        rates = {'stars': len(obs.indep)})
+    progress.start()
+
+    fit_data = []
+    maximum  = -np.inf
+    row = 0
+    for afe, feh, age in nodes:
+        progress.update()
+        iso = isochrone.Isochrone(age, feh, alpha_enhancement = afe,
+                                  brand = isochrone_brand)
+        if not iso.exists:
+            continue
+        lnL = systemLogLikelihoods(obs, iso, lazy = True)
+        fit_data.append([age/1.e6, feh, afe, np.sum(lnL), lnL])
+        if fit_data[-1][3] > maximum:
+            maximum = fit_data[-1][3]
+            row = len(fit_data) - 1
+    progress.finish()
+
+    if len(fit_data) == 0:
+        print 'ERROR: No {0} isochrones were found to fit.\n'.format(isochrone_brand)
+        return None
+
+    if return_all:
+        return row, fit_data
+    else:
+        return fit_data[row]
+
+
+def compareStorage(systems, isochrone_brand, dtype = 'float32', fit_using = 'mass',
+                   compare_to = []):
+    """ Check a reduced precision storage type against double precision fits
+
+        The systems are fit with isochrones stored in double precision and
+        again with isochrones stored in the given data type (see
+        defs.setStorageDtype). The storage type in use beforehand is
+        restored afterwards.
+
+        Required Arguments:
+        -------------------
+        systems          ::  list of star, binary, or multiple system objects.
+
+        isochrone_brand  ::  string of the particular model set.
+
+        Optional Arguments:
+        -------------------
+        dtype            ::  storage data type to check.
+
+        fit_using        ::  independent variable for fitting data to models.
+
+        compare_to       ::  variables to perform comparison over.
+
+        Returns:
+        --------
+        comparison       ::  dictionary with the largest absolute difference
+                             in joint log-likelihood over the grid
+                             ('max_dlnL'), whether both fits select the same
+                             isochrone ('same_best'), and the number of
+                             isochrones compared ('nodes').
+
+    """
+    from ..model import defs
+
+    previous = defs.getStorageDtype()
+    try:
+        defs.setStorageDtype('float64')
+        row64, fits64 = coevalFit(systems, isochrone_brand, fit_using = fit_using,
+                                  compare_to = compare_to, return_all = True)
+        defs.setStorageDtype(dtype)
+        row32, fits32 = coevalFit(systems, isochrone_brand, fit_using = fit_using,
+                                  compare_to = compare_to, return_all = True)
+    finally:
+        defs.setStorageDtype(previous)
+
+    lnL64 = np.array([line[3] for line in fits64])
+    lnL32 = np.array([line[3] for line in fits32])
+    finite = np.isfinite(lnL64) & np.isfinite(lnL32)
+    agree  = np.array_equal(np.isfinite(lnL64), np.isfinite(lnL32))
+    return {'max_dlnL': np.max(np.abs(lnL64[finite] - lnL32[finite])) if np.any(finite) else 0.,
+            'same_best': fits64[row64][:3] == fits32[row32][:3] and agree,
+            'nodes': len(fits64)}
@@ -0,0 +1,126 @@
+#
+#
+import time
+import numpy as np
+
+__all__ = ['fitBrands']
+
+def fitNodes(task):
+    """ Score a block of one brand's isochrones (run by a pool worker)
+
+        Required Arguments:
+        -------------------
+        task  ::  tuple of (Observations object, brand, list of
+                  (afe, feh, age) nodes).
+
+        Returns:
+        --------
+        brand, best [age (Myr), [Fe/H], [a/Fe], log-likelihood], number
+        of isochrones scored, and time spent (s).
+
+    """
+    from ..model import isochrone, manifest
+    from .coeval import systemLogLikelihoods
+
+    obs, brand, nodes = task
+    start = time.time()
+    manifest.getManifest(brand)
+
+    best = None
+    N = 0
+    for afe, feh, age in nodes:
+        iso = isochrone.Isochrone(age, feh, alpha_enhancement = afe, brand = brand)
+        if not iso.exists:
+            continue
+        lnL = np.sum(systemLogLikelihoods(obs, iso, lazy = True))
+        N  += 1
+        if best is None or lnL > best[3]:
+            best = [age/1.e6, feh, afe, lnL]
+    return brand, best, N, time.time() - start
+
+
+def fitBrands(system, brands = ['Dartmouth', 'DSEP08', 'Lyon19', 'Pisa', 'Yale'],
+              fit_using = 'mass', compare_to = [], processes = None, block = 50,
+              callback = None):
+    """ Fit one system against several model brands at the same time
+
+        The system's observations are packed once and shared by all tasks.
+        Every brand's grid is split into blocks of isochrones, and the
+        blocks of all brands are scheduled together on a process pool, so
+        the wall time is set by the total work divided among the workers
+        rather than by the sum of sequential per-brand fits.
+
+        Required Arguments:
+        -------------------
+        system      ::  stellar system object, or a list of coeval systems.
+
+        Optional Arguments:
+        -------------------
+        brands      ::  list of model brands to fit.
+
+        fit_using   ::  independent variable for fitting data to models.
+
+        compare_to  ::  variables to perform comparison over.
+
+        processes   ::  number of worker processes (defaults to all cores).
+
+        block       ::  number of isochrones per task.
+
+        callback    ::  function receiving progress events as blocks finish
+                        (see utils.progress.Progress).
+
+        Returns:
+        --------
+        table       ::  list with one row per brand: [brand, age (Myr),
+                        [Fe/H], [a/Fe], log-likelihood, isochrones scored,
+                        time spent on the brand (s)].
+
+    """
+    from multiprocessing import Pool
+    from ..model import defs, manifest
+    from ..utils.progress import Progress
+    from .coeval import Observations
+
+    if not isinstance(system, (list, tuple)):
+        system = [system]
+    obs = Observations(system, independent = fit_using, compare_to = compare_to)
+
+    tasks = []
+    for brand in brands:
+        if defs.getModelDirectory(brand) is None:
+            print 'WARNING: No model directory for {0}, skipping.\n'.format(brand)
+            continue
+        nodes  = manifest.getManifest(brand).isochroneNodes()
+        tasks += [(obs, brand, nodes[i:i + block]) for i in range(0, len(nodes), block)]
+
+    progress = Progress(callback, 'fitBrands', total = sum(len(task[2]) for task in tasks),
+                        rates = {'stars': len(obs.indep)})
+    progress.start()
+
+    pool    = Pool(processes)
+    results = []
+    for task, result in zip(tasks, pool.imap(fitNodes, tasks, chunksize = 1)):
+        results.append(result)
+        progress.update(len(task[2]))
+    pool.close()
+    pool.join()
+
+    # combine blocks of each brand
+    summary = {}
+    for brand, best, N, elapsed in results:
+        if brand not in summary:
+            summary[brand] = [None, 0, 0.]
+        entry = summary[brand]
+        if best is not None and (entry[0] is None or best[3] > entry[0][3]):
+            entry[0] = best
+        entry[1] += N
+        entry[2] += elapsed
+    progress.finish()
+
+    table = []
+    for brand in brands:
+        if brand not in summary or summary[brand][0] is None:
+            continue
+        best, N, elapsed = summary[brand]
+        table.append([brand] + best + [N, elapsed])
+    return table
@@ -0,0 +1,484 @@
+#
+#
+import os
+import time
+import threading
+from collections import deque
+
+__all__ = ['Coordinator', 'runWorker', 'fitBlock', 'distributedBestFit', 'checkQueue']
+
+# hosts reachable from this machine only
+local_hosts = ['localhost', '127.0.0.1', '::1']
+
+
+class Coordinator(object):
+
+    def __init__(self, tasks, address = ('localhost', 0), authkey = None,
+                 lease = 300., retries = 3):
+        """ TCP work queue handing out tasks to remote workers
+
+            Each task is a (function, argument) pair; both are pickled and
+            sent to a worker, which returns function(argument). Functions
+            must be importable by the workers, i.e. module level functions
+            of this package. Tasks are leased to a worker for a limited
+            time. A task is handed out again if its lease expires or its
+            worker disconnects, and is abandoned after failing retries
+            times. Connections are authenticated with authkey; as the
+            messages are pickles, anyone holding the key can run code on
+            the coordinator and its workers.
+
+            Required Arguments:
+            -------------------
+            tasks    ::  list of (function, argument) tuples.
+
+            Optional Arguments:
+            -------------------
+            address  ::  (host, port) to listen on. Port 0 picks a free port,
+                         available afterwards as the address attribute.
+
+            authkey  ::  shared secret of the coordinator and its workers.
+                         Defaults to a random key, available afterwards as
+                         the authkey attribute to be passed to runWorker.
+
+            lease    ::  time (s) a worker may hold a task.
+
+            retries  ::  number of attempts made for each task.
+
+            Returns:
+            --------
+            Coordinator object.
+
+        """
+        from multiprocessing.connection import Listener
+
+        if authkey is None:
+            authkey = os.urandom(32)
+
+        self.tasks    = list(tasks)
+        self.lease    = lease
+        self.retries  = retries
+        self.pending  = deque(range(len(self.tasks)))
+        self.leases   = {}
+        self.attempts = [0]*len(self.tasks)
+        self.results  = {}
+        self.failed   = {}
+        self.lock     = threading.Lock()
+
+        # the default backlog of 1 stalls workers connecting at the same time
+        self.listener = Listener(address, backlog = 128, authkey = authkey)
+        self.address  = self.listener.address
+        self.authkey  = authkey
+
+
+    def done(self):
+        """ Whether every task has a result or was abandoned """
+        with self.lock:
+            return len(self.results) + len(self.failed) == len(self.tasks)
+
+
+    def next(self, owner):
+        """ Lease the next task to a worker, expiring stale leases first """
+        with self.lock:
+            now = time.time()
+            for task_id, (expires, holder) in self.leases.items():
+                if expires < now:
+                    self.release(task_id, 'lease expired')
+            if len(self.pending) > 0:
+                task_id = self.pending.popleft()
+                self.attempts[task_id] += 1
+                self.leases[task_id] = (now + self.lease, owner)
+                return ('task', task_id, self.tasks[task_id])
+            elif len(self.leases) > 0:
+                return ('wait',)
+            return ('done',)
+
+
+    def release(self, task_id, error):
+        """ Return a leased task to the queue, or abandon it (lock held) """
+        self.leases.pop(task_id, None)
+        if task_id in self.results or task_id in self.failed:
+            return
+        if self.attempts[task_id] >= self.retries:
+            self.failed[task_id] = error
+        else:
+            self.pending.append(task_id)
+
+
+    def handle(self, conn):
+        """ Serve requests of one worker connection """
+        owner = object()
+        try:
+            while True:
+                message = conn.recv()
+                if message[0] == 'lease':
+                    conn.send(self.next(owner))
+                    continue
+                with self.lock:
+                    if message[0] == 'result':
+                        if message[1] in self.leases or message[1] in self.pending:
+                            self.leases.pop(message[1], None)
+                            if message[1] in self.pending:
+                                self.pending.remove(message[1])
+                            self.results[message[1]] = message[2]
+                    elif message[0] == 'fail':
+                        self.release(message[1], message[2])
+                conn.send(('ok',))
+        except (EOFError, IOError):
+            pass
+        finally:
+            # tasks held by a dead worker are handed out again
+            with self.lock:
+                for task_id, (expires, holder) in self.leases.items():
+                    if holder is owner:
+                        self.release(task_id, 'worker disconnected')
+            conn.close()
+
+
+    def accept(self):
+        """ Accept worker connections, each served by its own thread """
+        while True:
+            try:
+                conn = self.listener.accept()
+            except Exception:
+                if self.done():
+                    return
+                continue
+            thread = threading.Thread(target = self.handle, args = (conn,))
+            thread.daemon = True
+            thread.start()
+
+
+    def startWorkers(self, N):
+        """ Start N worker processes on this machine
+
+            Returns:
+            --------
+            List of the (daemonic) worker processes.
+
+        """
+        from multiprocessing import Process
+        workers = [Process(target = localWorker, args = (self.listener, self.address,
+                                                          self.authkey))
+                   for k in range(N)]
+        for worker in workers:
+            worker.daemon = True
+            worker.start()
+        return workers
+
+
+    def run(self, poll = 0.1, callback = None):
+        """ Serve workers until all tasks are finished
+
+            Optional Arguments:
+            -------------------
+            poll      ::  time (s) between checks of the queue.
+
+            callback  ::  function receiving progress events as tasks finish
+                          (see utils.progress.Progress).
+
+            Returns:
+            --------
+            results  ::  list of task results in task order (None for
+                         abandoned tasks).
+
+            failed   ::  dictionary of the last error of abandoned tasks.
+
+        """
+        from ..utils.progress import Progress
+
+        progress = Progress(callback, 'Coordinator', total = len(self.tasks), unit = 'tasks')
+        progress.start()
+        thread = threading.Thread(target = self.accept)
+        thread.daemon = True
+        thread.start()
+        while not self.done():
+            time.sleep(poll)
+            # expire leases even when no worker is asking for tasks
+            with self.lock:
+                now = time.time()
+                for task_id, (expires, holder) in self.leases.items():
+                    if expires < now:
+                        self.release(task_id, 'lease expired')
+                finished = len(self.results) + len(self.failed)
+                metrics  = {'leased': len(self.leases), 'failed': len(self.failed)}
+            if finished > progress.done:
+                progress.update(finished - progress.done, **metrics)
+        progress.finish(leased = 0, failed = len(self.failed))
+
+        # wake the accepting thread so it exits before the socket is closed,
+        # otherwise it may accept on a new socket reusing the descriptor
+        import socket
+        try:
+            socket.create_connection(self.address, 5.).close()
+        except socket.error:
+            pass
+        thread.join(5.)
+        self.listener.close()
+        return [self.results.get(k) for k in range(len(self.tasks))], self.failed
+
+
+def runWorker(address, authkey, poll = 0.5):
+    """ Process tasks from a coordinator until none are left
+
+        Workers read isochrones from their own model directories, which
+        should point to the same (e.g. network mounted) model tree.
+
+        Required Arguments:
+        -------------------
+        address  ::  (host, port) of the coordinator.
+
+        authkey  ::  shared secret of the coordinator (its authkey
+                     attribute).
+
+        Optional Arguments:
+        -------------------
+        poll     ::  time (s) to wait while other workers finish the last
+                     tasks.
+
+        Returns:
+        --------
+        Number of tasks completed.
+
+    """
+    from multiprocessing.connection import Client
+
+    conn = Client(tuple(address), authkey = authkey)
+    N = 0
+    try:
+        while True:
+            conn.send(('lease',))
+            reply = conn.recv()
+            if reply[0] == 'done':
+                break
+            elif reply[0] == 'wait':
+                time.sleep(poll)
+                continue
+            task_id, (function, argument) = reply[1:]
+            try:
+                message = ('result', task_id, function(argument))
+                N += 1
+            except Exception as err:
+                message = ('fail', task_id, repr(err))
+            conn.send(message)
+            conn.recv()
+    except (EOFError, IOError):
+        pass
+    conn.close()
+    return N
+
+
+def localWorker(listener, address, authkey):
+    """ Worker process forked from the coordinator's process """
+    # the inherited listening socket would keep the coordinator's port open
+    listener.close()
+    return runWorker(address, authkey)
+
+
+def fitBlock(task):
+    """ bestFit rows for a block of isochrones (run by a worker)
+
+        Required Arguments:
+        -------------------
+        task  ::  tuple of (system, brand, fit_using, compare_to, list of
+                  (afe, feh, age) nodes).
+
+        Returns:
+        --------
+        fit_data rows, as in isofit.bestFit, of the nodes with an isochrone.
+
+    """
+    from ..model.isochrone import Isochrone
+    from .isofit import residuals
+
+    system, brand, fit_using, compare_to, nodes = task
+    rows = []
+    for afe, feh, age in nodes:
+        iso = Isochrone(age, feh, alpha_enhancement = afe, brand = brand)
+        if not iso.exists:
+            continue
+        resids = residuals(system, iso, independent = fit_using,
+                           compare_to = list(compare_to), lazy = True)
+        rows.append([iso.age/1.e3, iso.Fe_H, iso.A_Fe, resids[4], resids[1][0][0],
+                     resids[1][0][1], resids[1][0][2], resids[1][0][3]])
+    return rows
+
+
+def distributedBestFit(system, isochrone_brand, fit_using = 'mass', compare_to = [],
+                       return_all = False, address = ('localhost', 0),
+                       authkey = None, block = 50, lease = 300.,
+                       retries = 3, local_workers = 0, callback = None):
+    """ Finds the best fit isochrone, spreading the grid over many machines
+
+        The brand's grid is split into blocks of isochrones that are
+        served by a Coordinator. Workers are started on other machines
+        with runWorker(address, authkey), and local worker processes may
+        be started as well. The results are combined in grid order, so
+        the output is the same as that of isofit.bestFit.
+
+        Required Arguments:
+        -------------------
+        system           ::  stellar system object.
+
+        isochrone_brand  ::  string of the particular model set.
+
+        Optional Arguments:
+        -------------------
+        fit_using        ::  independent variable for fitting data to models.
+
+        compare_to       ::  variables to perform comparison over.
+
+        return_all       ::  return fit data for every isochrone.
+
+        address          ::  (host, port) the coordinator listens on.
+
+        authkey          ::  shared secret of the coordinator and workers.
+                             Required unless the coordinator listens on
+                             localhost, where a random key is used.
+
+        block            ::  number of isochrones per task.
+
+        lease            ::  time (s) a worker may hold a task.
+
+        retries          ::  number of attempts made for each task.
+
+        local_workers    ::  number of worker processes started on this
+                             machine.
+
+        callback         ::  function receiving progress events as blocks
+                             finish (see utils.progress.Progress).
+
+        Returns:
+        --------
+        fit_data[row]    ::  properties of the best fit isochrone.
+
+        row              ::  (optional) row in fit_data of the best fit.
+
+        fit_data         ::  (optional) likelihood data for each isochrone.
+
+    """
+    from ..model import manifest
+
+    if authkey is None and address[0] not in local_hosts:
+        print 'ERROR: An authkey is required to serve workers on {0}.\n'.format(address[0])
+        return None
+
+    nodes = manifest.getManifest(isochrone_brand).isochroneNodes()
+    tasks = [(fitBlock, (system, isochrone_brand, fit_using, list(compare_to),
+                         nodes[i:i + block])) for i in range(0, len(nodes), block)]
+
+    coordinator = Coordinator(tasks, address = address, authkey = authkey,
+                              lease = lease, retries = retries)
+    workers = coordinator.startWorkers(local_workers)
+
+    results, failed = coordinator.run(callback = callback)
+    for worker in workers:
+        worker.join()
+    if len(failed) > 0:
+        print 'WARNING: {0} of {1} tasks failed: {2}\n'.format(len(failed), len(tasks),
+                                                               failed.values()[0])
+
+    fit_data = []
+    maximum  = 0.
+    row = 0
+    for rows in results:
+        for line in rows or []:
+            if line[3] > maximum:
+                maximum = line[3]
+                row = len(fit_data)
+            fit_data.append(line)
+
+    if len(fit_data) == 0:
+        print 'ERROR: No {0} isochrones were fit.\n'.format(isochrone_brand)
+        return None
+
+    if return_all:
+        return row, fit_data
+    else:
+        return fit_data[row]
+
+
+def checkTask(argument):
+    """ Task of checkQueue: squares a number, failing or stalling on request
+
+        Required Arguments:
+        -------------------
+        argument  ::  tuple of (number, mode, marker file). Mode 'fail'
+                      always raises; mode 'stall' sleeps through the lease
+                      the first time it is run, creating the marker file.
+
+    """
+    x, mode, marker = argument
+    if mode == 'fail':
+        raise ValueError('task {0} fails'.format(x))
+    if mode == 'stall' and not os.path.exists(marker):
+        open(marker, 'w').close()
+        time.sleep(60.)
+    return x*x
+
+
+def checkQueue(N_workers = 3, N_tasks = 10, lease = 1., retries = 2):
+    """ Run a work queue with local workers on this machine and check it
+
+        Tasks squaring numbers are served to local worker processes. One
+        task always fails and must be abandoned after retries attempts,
+        one stalls past its lease the first time and must be handed out
+        again, and a client with a wrong authkey must be refused.
+
+        Optional Arguments:
+        -------------------
+        N_workers  ::  number of local worker processes.
+
+        N_tasks    ::  number of tasks that succeed at once.
+
+        lease      ::  time (s) a worker may hold a task.
+
+        retries    ::  number of attempts made for each task.
+
+        Returns:
+        --------
+        True if every check passed.
+
+    """
+    import shutil
+    import tempfile
+    from multiprocessing import AuthenticationError
+    from multiprocessing.connection import Client
+
+    directory = tempfile.mkdtemp()
+    marker = os.path.join(directory, 'stalled')
+    tasks  = [(checkTask, (x, 'ok', marker)) for x in range(N_tasks)]
+    tasks += [(checkTask, (N_tasks, 'fail', marker)), (checkTask, (N_tasks + 1, 'stall', marker))]
+
+    coordinator = Coordinator(tasks, lease = lease, retries = retries)
+    refused = []
+    def intrude():
+        try:
+            Client(coordinator.address, authkey = 'dsetools').close()
+        except AuthenticationError:
+            refused.append(True)
+    intruder = threading.Thread(target = intrude)
+    intruder.daemon = True
+
+    workers = coordinator.startWorkers(N_workers)
+    intruder.start()
+    results, failed = coordinator.run()
+    intruder.join(5.)
+    # the stalled worker is still asleep
+    for worker in workers:
+        worker.join(1.)
+        if worker.is_alive():
+            worker.terminate()
+    shutil.rmtree(directory, ignore_errors = True)
+
+    checks = [('results', results[:N_tasks] == [x*x for x in range(N_tasks)]),
+              ('retries', N_tasks in failed and coordinator.attempts[N_tasks] == retries),
+              ('lease', results[N_tasks + 1] == (N_tasks + 1)**2 and
+                        coordinator.attempts[N_tasks + 1] == 2),
+              ('authkey', len(refused) == 1)]
+    for name, passed in checks:
+        print '{:<10s}{}'.format(name, 'ok' if passed else 'FAILED')
+    return all(passed for name, passed in checks)
+
+
+if __name__ == '__main__':
+    checkQueue()
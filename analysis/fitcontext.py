@@ -0,0 +1,165 @@
+#
+#
+from scipy.interpolate import interp1d
+import numpy as np
+
+__all__ = ['FitContext']
+
+# star attribute holding each isochrone property
+star_attributes = {'mass': 'mass', 'teff': 'Teff', 'luminosity': 'luminosity',
+                   'radius': 'radius'}
+
+
+class FitContext(object):
+
+    def __init__(self, isochrone, mass_grid_space = 0.001,
+                 properties = ['teff', 'luminosity', 'radius'], lazy = False):
+        """ Isochrone-side quantities of a fit, computed once
+
+            The dense mass grid, the model properties interpolated onto it
+            and their derivatives with respect to mass are computed when
+            the context is created, along with a table of the linear
+            segments of the isochrone used to evaluate properties at any
+            mass. Stars can then be scored against the isochrone
+            repeatedly, e.g. for what-if analyses or bootstrap resampling,
+            without repeating any of this work.
+
+            Required Arguments:
+            -------------------
+            isochrone        ::  stellar evolution isochrone object.
+
+            Optional Arguments:
+            -------------------
+            mass_grid_space  ::  spacing of the dense mass grid.
+
+            properties       ::  isochrone columns interpolated onto the grid.
+
+            lazy             ::  load an isochrone that is not loaded yet
+                                 without unlogging it or adding columns, for
+                                 isochrones the caller does not keep.
+
+            Returns:
+            --------
+            FitContext object.
+
+        """
+        if not isochrone.is_loaded:
+            isochrone.loadIsochrone(lazy = lazy)
+        self.isochrone       = isochrone
+        self.mass_grid_space = mass_grid_space
+
+        mass_r = np.asarray(isochrone.col('mass'), dtype = np.float64)
+        self.masses = np.arange(min(mass_r), max(mass_r) - mass_grid_space, mass_grid_space)
+        self.curves = {'mass': self.masses}
+        self.slopes = {'mass': np.ones(len(self.masses))}
+
+        # segment table: sorted knots and slope of every segment
+        order = np.argsort(mass_r)
+        self.knots    = mass_r[order]
+        self.values   = {'mass': self.knots}
+        self.segments = {'mass': np.ones(len(self.knots) - 1)}
+        with np.errstate(divide = 'ignore', invalid = 'ignore'):
+            for prop in properties:
+                # curves are kept in double precision whatever the storage type
+                y = np.asarray(isochrone.col(prop), dtype = np.float64)
+                self.curves[prop] = interp1d(mass_r, y)(self.masses)
+                self.slopes[prop] = np.gradient(self.curves[prop], mass_grid_space)
+                self.values[prop] = y[order]
+                self.segments[prop] = np.diff(y[order])/np.diff(self.knots)
+        self.star = None
+        self.obs  = {}
+
+
+    def evaluate(self, prop, mass):
+        """ Model property at arbitrary masses from the segment table """
+        mass = np.asarray(mass, dtype = float)
+        i = np.clip(np.searchsorted(self.knots, mass) - 1, 0, len(self.knots) - 2)
+        result = self.values[prop][i] + self.segments[prop][i]*(mass - self.knots[i])
+        outside = (mass < self.knots[0]) | (mass > self.knots[-1])
+        return np.where(outside, np.nan, result)
+
+
+    def update(self, star):
+        """ Bind the context to a star's observed values and uncertainties """
+        self.star = star
+        self.obs  = {}
+        for prop, attribute in star_attributes.items():
+            value, sigma = getattr(star, attribute)
+            if value is not None and sigma:
+                self.obs[prop] = (float(value), float(sigma))
+        return self
+
+
+    def nsigma(self, prop):
+        """ Number of standard deviations between model and star along the grid """
+        if prop not in self.obs or prop not in self.curves:
+            return None
+        value, sigma = self.obs[prop]
+        return (self.curves[prop] - value)/sigma
+
+
+    def score(self, star = None, compare_to = ['mass', 'radius', 'teff']):
+        """ Goodness of fit at each point of the mass grid
+
+            As in isofit.resids, the root mean square of the number of
+            standard deviations between the star and the model over the
+            compared properties. Properties the star does not provide
+            are left out.
+
+            Optional Arguments:
+            -------------------
+            star        ::  star object; if given, the context is updated
+                            to it first.
+
+            compare_to  ::  properties to compare.
+
+            Returns:
+            --------
+            RMSD        ::  array of the fit coefficient at every mass.
+
+        """
+        if star is not None:
+            self.update(star)
+        terms = [self.nsigma(prop) for prop in compare_to]
+        terms = [term for term in terms if term is not None]
+        if len(terms) == 0:
+            return np.zeros(len(self.masses))*np.nan
+        return np.sqrt(np.sum(np.square(terms), axis = 0)/len(terms))
+
+
+    def best(self, star = None, compare_to = ['mass', 'radius', 'teff']):
+        """ Best fitting mass, refined between grid points
+
+            The grid minimum of the squared deviations is refined with a
+            Gauss-Newton step using the tabulated derivatives, limited to
+            the neighboring grid points, and the model is re-evaluated
+            exactly at the refined mass from the segment table.
+
+            Returns:
+            --------
+            mass, RMSD  ::  best fitting mass and the fit coefficient there.
+
+        """
+        rmsd = self.score(star, compare_to)
+        if np.all(np.isnan(rmsd)):
+            return None, None
+        k  = np.nanargmin(rmsd)
+        dm = 0.
+        gradient, hessian = 0., 0.
+        props = [prop for prop in compare_to if self.nsigma(prop) is not None]
+        for prop in props:
+            value, sigma = self.obs[prop]
+            gradient += (self.curves[prop][k] - value)*self.slopes[prop][k]/sigma**2
+            hessian  += (self.slopes[prop][k]/sigma)**2
+        if hessian > 0.:
+            dm = np.clip(-gradient/hessian, -self.mass_grid_space, self.mass_grid_space)
+        mass = self.masses[k] + dm
+
+        chi2 = 0.
+        for prop in props:
+            value, sigma = self.obs[prop]
+            chi2 += ((self.evaluate(prop, mass) - value)/sigma)**2
+        rmsd_refined = np.sqrt(chi2/len(props))
+        if not rmsd_refined <= rmsd[k]:
+            return self.masses[k], rmsd[k]
+        return float(mass), float(rmsd_refined)
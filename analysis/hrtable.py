@@ -0,0 +1,169 @@
+#
+#
+import json
+import numpy as np
+
+__all__ = ['HRTable', 'buildHRTable']
+
+# quantities tabulated in every cell
+quantities = ['mass', 'e_mass', 'logage', 'e_logage', 'feh', 'e_feh']
+
+
+class HRTable(object):
+
+    def __init__(self, filepath, mmap_mode = 'r'):
+        """ Inverse mapping of a model grid from the HR diagram
+
+            Mass, log age and [Fe/H] of the models, with their spread, are
+            tabulated on a regular grid of (log Teff, log L). The table is
+            stored as a .npy file, memory-mapped when loaded, alongside a
+            .json file describing its axes (see buildHRTable).
+
+            Required Arguments:
+            -------------------
+            filepath   ::  location of the table (.npy) file.
+
+            Optional Arguments:
+            -------------------
+            mmap_mode  ::  numpy memory-map mode, or None to read the table
+                           fully into memory.
+
+            Returns:
+            --------
+            HRTable object.
+
+        """
+        from ..model.cube import metaPath
+        from ..utils.compress import openFile
+
+        self.filepath = filepath
+        fin  = openFile(metaPath(filepath))
+        meta = json.load(fin)
+        fin.close()
+
+        self.brand      = meta['brand']
+        self.quantities = meta['quantities']
+        self.logteff    = np.array(meta['logteff'])
+        self.logl       = np.array(meta['logl'])
+        self.table      = np.load(filepath, mmap_mode = mmap_mode)
+
+
+    def lookup(self, teff, luminosity):
+        """ Interpolated model quantities of many stars at once
+
+            The table is bilinearly interpolated at each star's (log Teff,
+            log L). Stars outside of the area covered by the models get NaN.
+
+            Required Arguments:
+            -------------------
+            teff        ::  array of effective temperatures (K).
+
+            luminosity  ::  array of luminosities (Lsun).
+
+            Returns:
+            --------
+            values      ::  array with one row per star and one column per
+                            quantity (mass, e_mass, logage, e_logage, feh,
+                            e_feh), ages in log10(yr).
+
+        """
+        with np.errstate(invalid = 'ignore', divide = 'ignore'):
+            x = np.log10(np.asarray(teff, dtype = float))
+            y = np.log10(np.asarray(luminosity, dtype = float))
+
+        fx = (x - self.logteff[0])/(self.logteff[1] - self.logteff[0])
+        fy = (y - self.logl[0])/(self.logl[1] - self.logl[0])
+        inside = (fx >= 0.) & (fx <= len(self.logteff) - 1) & \
+                 (fy >= 0.) & (fy <= len(self.logl) - 1)
+        fx = np.where(inside, fx, 0.)
+        fy = np.where(inside, fy, 0.)
+        i  = np.minimum(fx.astype(int), len(self.logteff) - 2)
+        j  = np.minimum(fy.astype(int), len(self.logl) - 2)
+        wx = (fx - i)[:, np.newaxis]
+        wy = (fy - j)[:, np.newaxis]
+
+        values = (self.table[i, j]*(1. - wx)*(1. - wy) + self.table[i + 1, j]*wx*(1. - wy) +
+                  self.table[i, j + 1]*(1. - wx)*wy + self.table[i + 1, j + 1]*wx*wy)
+        values[~inside] = np.nan
+        return values
+
+
+def buildHRTable(brand, filepath = None, N_teff = 300, N_lumi = 300,
+                 mass_grid_space = 0.005):
+    """ Tabulate mass, age and [Fe/H] of a model grid over the HR diagram
+
+        Every isochrone of the brand is sampled on a dense mass grid (see
+        survey.loadGridPoints) and each point is binned onto a regular
+        (log Teff, log L) grid. Each cell holds the mean and standard
+        deviation of the mass, log age and [Fe/H] of its points, so every
+        sampled model has equal weight. Cells falling between isochrones
+        are filled by linear interpolation over a triangulation of the
+        populated cells; cells outside the area covered by the models are
+        NaN.
+
+        Required Arguments:
+        -------------------
+        brand            ::  modeling group.
+
+        Optional Arguments:
+        -------------------
+        filepath         ::  location of the table file. Defaults to
+                             '{brand}_hr_table.npy' in the model directory.
+
+        N_teff           ::  number of log Teff grid points.
+
+        N_lumi           ::  number of log L grid points.
+
+        mass_grid_space  ::  mass spacing along each isochrone.
+
+        Returns:
+        --------
+        HRTable object, memory-mapped read-only.
+
+    """
+    from scipy.interpolate import griddata
+    from ..model import defs
+    from ..model.cube import metaPath
+    from .survey import loadGridPoints
+
+    if filepath is None:
+        filepath = '{0}/{1}_hr_table.npy'.format(defs.getModelDirectory(brand), brand)
+
+    nodes, points, masses, owner = loadGridPoints(brand, ['teff', 'luminosity'],
+                                                  mass_grid_space = mass_grid_space)
+    points = np.asarray(points, dtype = np.float64)
+    ok     = np.all(np.isfinite(points), axis = 1)
+    points, masses, owner = points[ok], masses[ok], owner[ok]
+
+    logteff = np.linspace(points[:, 0].min(), points[:, 0].max(), N_teff)
+    logl    = np.linspace(points[:, 1].min(), points[:, 1].max(), N_lumi)
+
+    # nearest grid point of every model point
+    i = np.rint((points[:, 0] - logteff[0])/(logteff[1] - logteff[0])).astype(int)
+    j = np.rint((points[:, 1] - logl[0])/(logl[1] - logl[0])).astype(int)
+    cell  = i*N_lumi + j
+    count = np.bincount(cell, minlength = N_teff*N_lumi).astype(float)
+
+    table = np.empty((N_teff*N_lumi, len(quantities)))
+    table.fill(np.nan)
+    filled = count > 0
+    values = [masses, np.log10(nodes[owner, 0]), nodes[owner, 1]]
+    for k, value in enumerate(values):
+        mean = np.bincount(cell, weights = value, minlength = len(count))[filled]/count[filled]
+        sqr  = np.bincount(cell, weights = value**2, minlength = len(count))[filled]/count[filled]
+        table[filled, 2*k]     = mean
+        table[filled, 2*k + 1] = np.sqrt(np.maximum(sqr - mean**2, 0.))
+
+    # interpolate across empty cells between isochrones
+    grid = np.column_stack((np.repeat(logteff, N_lumi), np.tile(logl, N_teff)))
+    if np.any(~filled):
+        table[~filled] = griddata(grid[filled], table[filled], grid[~filled], method = 'linear')
+
+    np.save(filepath, table.reshape(N_teff, N_lumi, len(quantities)))
+    meta = {'brand': brand, 'quantities': quantities, 'logteff': logteff.tolist(),
+            'logl': logl.tolist(), 'mass_grid_space': mass_grid_space}
+    fout = open(metaPath(filepath), 'w')
+    json.dump(meta, fout)
+    fout.close()
+
+    return HRTable(filepath)
@@ -1,11 +1,13 @@
 #
 #
 from scipy.interpolate import interp1d
+from math import sqrt, pi, exp
 import numpy as np
 
-__all__ = ['resids', 'residuals', 'bestFit', 'saveLikelihoodData']
+__all__ = ['resids', 'jointResids', 'residuals', 'bestFit', 'saveLikelihoodData']
 
-def resids(system, isochrone, output_file = None, mass_grid_space = 0.001):
+def resids(system, isochrone, output_file = None, mass_grid_space = 0.001, context = None,
+           joint = False):
     """ Calculate residuals between components of a system and an isochrone.
     
         This routine takes a system of stars and calculates the goodness
@@ -21,34 +23,34 @@ def resids(system, isochrone, output_file = None, mass_grid_space = 0.001):
          
         isochrone    ::  stellar evolution isochrone object
         
+        Optional Arguments
+        -------------------
+        context      ::  fitcontext.FitContext of the isochrone, reused to
+                         avoid interpolating the isochrone on every call.
+        
+        joint        ::  for a binary, compare the secondary's temperature
+                         difference against the primary mass of the joint
+                         (m1, m2) fit (see jointResids) rather than the
+                         primary's own best fit.
+        
     """
+    from .fitcontext import FitContext
+    
     if system.N_components == 1:
         system.stars = [system]
     
-    # check if isochrone is load, if not, load it.
-    if isochrone.is_loaded:
-        pass
-    else:
-        isochrone.loadIsochrone()
-    
-    # get isochrone properties
-    mass_col = isochrone.column['mass']
-    teff_col = isochrone.column['teff']
-    lumi_col = isochrone.column['luminosity']
-    radi_col = isochrone.column['radius']
-    
-    mass_r = isochrone.isochrone[:, mass_col]
-    masses = np.arange(min(mass_r), max(mass_r) - mass_grid_space, mass_grid_space)
-    
     # interpolate masses onto isochrone for each model property (teff, radius, luminosity)
-    icurve = interp1d(isochrone.isochrone[:, mass_col], isochrone.isochrone[:, teff_col])
-    i_teff = icurve(masses)
-    
-    icurve = interp1d(isochrone.isochrone[:, mass_col], isochrone.isochrone[:, lumi_col])
-    i_lumi = icurve(masses)
+    if context is None or context.isochrone is not isochrone or \
+            context.mass_grid_space != mass_grid_space:
+        context = FitContext(isochrone, mass_grid_space)
+    masses = context.masses
+    i_teff = context.curves['teff']
+    i_lumi = context.curves['luminosity']
+    i_radi = context.curves['radius']
     
-    icurve = interp1d(isochrone.isochrone[:, mass_col], isochrone.isochrone[:, radi_col])
-    i_radi = icurve(masses)
+    joint_fit = None
+    if joint and len(system.stars) == 2:
+        joint_fit = jointResids(system, isochrone, mass_grid_space, context = context)
     
     # compute residual at each point along the isochrone for each star
     for star in system.stars:
@@ -119,7 +121,7 @@ def resids(system, isochrone, output_file = None, mass_grid_space = 0.001):
             
         star_resids = np.column_stack((star_resids, radius_resid))
         star_resids = np.column_stack((star_resids, teff_resid))
-        if tdiff_resid != None:
+        if tdiff_resid is not None:
             star_resids = np.column_stack((star_resids, tdiff_resid))
         else:
             pass
@@ -127,6 +129,8 @@ def resids(system, isochrone, output_file = None, mass_grid_space = 0.001):
         
         # to allow for comparison of temperature difference
         prim_bstfit = np.nanargmin(star_resids[:,6])
+        if joint_fit is not None and joint_fit[4] is not None:
+            prim_bstfit = joint_fit[4]
     
     if output_file != None:
         np.savetxt(output_file.name, star_resids, fmt='%10.4e', delimiter = '  ' )
@@ -136,7 +140,108 @@ def resids(system, isochrone, output_file = None, mass_grid_space = 0.001):
     return star_resids
     
 
-def residuals(system, isochrone, independent = 'mass', compare_to = []):
+def jointResids(system, isochrone, mass_grid_space = 0.001, context = None,
+                compare_to = ['mass', 'radius', 'teff'],
+                pair_terms = ['teff_diff', 'mass_ratio', 'radius_sum'], window = 5.,
+                max_pairs = 2**20):
+    """ Joint fit of both components of a binary along one isochrone
+    
+        Both stars are placed on the same isochrone and the chi-square of
+        every pair of masses (m1, m2) is computed at once: each star's own
+        properties plus the binary's Teff difference, mass ratio and radius
+        sum. Only masses within window standard deviations of each star's
+        own best fit (in chi-square) are searched, which bounds the 2-D
+        grid; stars without their own properties are searched over the
+        whole isochrone. The grid is evaluated in blocks of primary masses
+        so that large regions do not exhaust memory.
+        
+        Required Arguments:
+        -------------------
+        system           ::  binary system object.
+        
+        isochrone        ::  stellar evolution isochrone object.
+        
+        Optional Arguments:
+        -------------------
+        mass_grid_space  ::  spacing of the mass grid.
+        
+        context          ::  fitcontext.FitContext of the isochrone.
+        
+        compare_to       ::  properties compared for each star.
+        
+        pair_terms       ::  properties of the binary compared, any of
+                             'teff_diff', 'mass_ratio' and 'radius_sum'.
+        
+        window           ::  half-width (standard deviations) of the region
+                             searched around each star's own best fit.
+        
+        max_pairs        ::  maximum number of mass pairs evaluated at once.
+        
+        Returns:
+        --------
+        [m1, m2, RMSD, chi2, i1, i2]  ::  best fitting masses, the fit
+                             coefficient and chi-square there, and the
+                             indices of the masses in the context's mass
+                             grid. All None if no pair of masses fits.
+    
+    """
+    from .fitcontext import FitContext
+    
+    if context is None or context.isochrone is not isochrone or \
+            context.mass_grid_space != mass_grid_space:
+        context = FitContext(isochrone, mass_grid_space)
+    
+    # chi-square profile of each star on its own, and the region searched
+    chi2, region, N_terms = [], [], 0
+    for star in system.stars[:2]:
+        context.update(star)
+        terms = [context.nsigma(prop) for prop in compare_to]
+        terms = [term for term in terms if term is not None]
+        N_terms += len(terms)
+        c = np.sum(np.square(terms), axis = 0) if len(terms) > 0 else \
+            np.zeros(len(context.masses))
+        c = np.where(np.isnan(c), np.inf, c)
+        chi2.append(c)
+        region.append(np.nonzero(c <= np.min(c) + window**2)[0])
+    i1, i2 = region
+    if len(i1) == 0 or len(i2) == 0:
+        return [None]*6
+    
+    curves = context.curves
+    observed = [('teff_diff', system.Teff_diff,
+                 lambda a, b: curves['teff'][a] - curves['teff'][b]),
+                ('mass_ratio', (system.mass_ratio, getattr(system, 'mrat_error', None)),
+                 lambda a, b: curves['mass'][b]/curves['mass'][a]),
+                ('radius_sum', (system.rad_sum, getattr(system, 'rsum_error', None)),
+                 lambda a, b: curves['radius'][a] + curves['radius'][b])]
+    observed = [(value, sigma, model) for name, (value, sigma), model in observed
+                if name in pair_terms and value is not None and sigma]
+    N_terms += len(observed)
+    if N_terms == 0:
+        return [None]*6
+    
+    # (m1, m2) grid of the region, primary along the rows, in blocks of rows
+    best, a, b = np.inf, None, None
+    rows = max(1, max_pairs//len(i2))
+    for start in range(0, len(i1), rows):
+        j1 = i1[start:start + rows]
+        total = chi2[0][j1][:, np.newaxis] + chi2[1][i2][np.newaxis, :]
+        with np.errstate(invalid = 'ignore'):
+            for value, sigma, model in observed:
+                total += ((model(j1[:, np.newaxis], i2[np.newaxis, :]) - value)/sigma)**2
+            total[np.isnan(total)] = np.inf
+        k = np.argmin(total)
+        if total.flat[k] < best:
+            best = total.flat[k]
+            a, b = j1[k//len(i2)], i2[k%len(i2)]
+    
+    if not np.isfinite(best):
+        return [None]*6
+    return [context.masses[a], context.masses[b], np.sqrt(best/N_terms), best, a, b]
+    
+
+def residuals(system, isochrone, independent = 'mass', compare_to = [], cache = None,
+              lazy = False):
     """ Calculate residuals between components of a system and an isochrone. 
     
         This routine takes a system of stars and fits them to a stellar
@@ -158,6 +263,15 @@ def residuals(system, isochrone, independent = 'mass', compare_to = []):
         
         compare_to   ::  variables to perform comparison over
         
+        cache        ::  cache.ResultCache object. If given, results stored
+                         for the same system inputs and isochrone file are
+                         returned without loading the isochrone.
+        
+        lazy         ::  load an isochrone that is not loaded yet without
+                         unlogging it or adding columns (see
+                         Isochrone.loadIsochrone). Results are the same;
+                         meant for isochrones the caller does not keep.
+        
         
         Returns:
         --------
@@ -176,6 +290,12 @@ def residuals(system, isochrone, independent = 'mass', compare_to = []):
         likelihood   ::  likelihood estimator for the given isochrone.
         
     """
+    if cache is not None:
+        key    = cache.key(system, isochrone, 'residuals', independent, list(compare_to))
+        result = cache.get(key)
+        if result is not None:
+            return result
+    
     if system.N_components == 1:
         system.stars = [system]
     
@@ -183,7 +303,7 @@ def residuals(system, isochrone, independent = 'mass', compare_to = []):
     if isochrone.is_loaded:
         pass
     else:
-        isochrone.loadIsochrone()
+        isochrone.loadIsochrone(lazy = lazy)
         
     # comparison variables
     if len(compare_to) == 0: 
@@ -194,27 +314,23 @@ def residuals(system, isochrone, independent = 'mass', compare_to = []):
     # select independent variable
     if independent.lower() in ['mass', 'm']:
         independent = 'mass'
-        dcol = isochrone.column[independent]
         comp_vars.pop(comp_vars.index(independent))
     elif independent.lower() in ['teff', 't_eff', 'temp', 't']:
         independent = 'teff'
-        dcol = isochrone.column[independent]
         comp_vars.pop(comp_vars.index(independent))
     elif independent.lower() in ['luminosity', 'lum', 'l']:
         independent = 'luminosity'
-        dcol = isochrone.column[independent]
         comp_vars.pop(comp_vars.index(independent))
     elif independent.lower() in ['radius', 'rad', 'r']:
         independent = 'radius'
-        dcol = isochrone.column[independent]
         comp_vars.pop(comp_vars.index(independent))
     elif independent.lower() in ['logg', 'gravity']:
         independent = 'logg'
-        dcol = isochrone.column[independent]
         comp_vars.pop(comp_vars.index(independent))
     else:
         print "ERROR: Invalid independent variable.\n"
         return None
+    x_iso = isochrone.col(independent)
     
     # Comparison to known observational properties
     theory = []    # theoretical predictions for observed stars
@@ -229,11 +345,10 @@ def residuals(system, isochrone, independent = 'mass', compare_to = []):
             obs = star.properties[star.pdict[prop]]
             
             try:
-                i = isochrone.column[prop]
+                y_iso = isochrone.col(prop)
             except KeyError:
                 continue
-            icurve = interp1d(isochrone.isochrone[:, dcol], 
-                              isochrone.isochrone[:, i], kind = 'linear')
+            icurve = interp1d(x_iso, y_iso, kind = 'linear')
             
             try:
                 model = icurve(star.properties[j][0])
@@ -289,12 +404,64 @@ def residuals(system, isochrone, independent = 'mass', compare_to = []):
                 #print "WARNING: Skipping {0} in likelihood calculation".format(comp_vars[i])
                 continue
     likelihood = pre*exp(-chi_2/2.)
+    
+    if cache is not None:
+        cache.put(key, (comp_vars, theory, errors, nsigma, likelihood))
         
     return comp_vars, theory, errors, nsigma, likelihood
 
 
+def saveCheckpoint(filename, state):
+    """ Atomically write the state of a bestFit scan to a checkpoint file """
+    import os
+    import pickle
+    fout = open(filename + '.tmp', 'wb')
+    pickle.dump(state, fout, pickle.HIGHEST_PROTOCOL)
+    fout.close()
+    os.rename(filename + '.tmp', filename)
+
+
+def loadCheckpoint(filename, key, nodes):
+    """ Read the state of an interrupted bestFit scan
+    
+        The checkpoint is only used if it was written by a scan of the same
+        system with the same brand and fit options over the same grid nodes
+        (key, see checkpointKey). Otherwise None is returned and the scan 
+        starts from the beginning.
+    """
+    import os
+    import pickle
+    if not os.path.isfile(filename):
+        return None
+    fin = open(filename, 'rb')
+    try:
+        # a partially written or foreign file can fail in many ways
+        state = pickle.load(fin)
+    except Exception:
+        state = None
+    fin.close()
+    
+    if not isinstance(state, dict) or state.get('key') != key:
+        state = None
+    if (state is None or state['position'] > len(nodes) or
+            list(nodes[state['position'] - 1]) != list(state['node'])):
+        print 'WARNING: Checkpoint {0} does not match this fit, ignoring it.\n'.format(filename)
+        return None
+    return state
+
+
+def checkpointKey(system, isochrone_brand, fit_using, compare_to, nodes):
+    """ Identity of a bestFit scan: the system's inputs, brand, options and nodes """
+    import hashlib
+    from .cache import systemInputs
+    return [isochrone_brand, fit_using, list(compare_to),
+            hashlib.sha1(repr(systemInputs(system))).hexdigest(),
+            hashlib.sha1(repr([tuple(node) for node in nodes])).hexdigest()]
+
+
 def bestFit(system, isochrone_brand, fit_using = 'mass', compare_to = [],
-            return_all = False):
+            return_all = False, prefetch = 0, stats = None, checkpoint = None,
+            checkpoint_every = 100, cache = None, callback = None):
     """ Finds the best fit isochrone for a system of stars 
     
         Given a stellar system (single star, binary, or multiple), this
@@ -318,6 +485,30 @@ def bestFit(system, isochrone_brand, fit_using = 'mass', compare_to = [],
         
         compare_to       ::  variables to perform comparison over.
         
+        prefetch         ::  number of isochrones read ahead in background
+                             threads while the current one is being fit.
+        
+        stats            ::  dictionary that, if given, is filled with the
+                             number of isochrones fit ('nodes') and the time 
+                             spent waiting on isochrone I/O ('io_wait').
+        
+        checkpoint       ::  file in which the progress of the scan is saved.
+                             If the file exists when the fit starts and was
+                             written by a scan of the same system, options
+                             and grid, the scan resumes after the last saved
+                             grid node. The file is removed once the scan is
+                             complete.
+        
+        checkpoint_every ::  number of grid nodes visited between checkpoints.
+        
+        cache            ::  cache.ResultCache object. Isochrones with stored
+                             results for this system are neither read nor 
+                             refit. Hits and misses are added to stats.
+        
+        callback         ::  function receiving progress events (see 
+                             utils.progress.Progress), with the same metrics
+                             as stats.
+        
         Returns:
         --------
         fit_data[row]    ::  properties of the best fit isochrone.
@@ -329,12 +520,12 @@ def bestFit(system, isochrone_brand, fit_using = 'mass', compare_to = [],
                              isochrone.
         
     """
-    from ..model import isochrone, defs
+    from ..model import prefetch as pf
+    from ..model import manifest
+    from ..model.isochrone import Isochrone
+    from ..utils.progress import Progress
     
-    # get properties of the model set
-    feh_range = defs.getFeHRange(isochrone_brand)
-    afe_range = defs.getAFeRange(isochrone_brand)
-    age_range = defs.getAgeRange(isochrone_brand)
+    nodes = manifest.getManifest(isochrone_brand).isochroneNodes()
     
     # compute residuals/likelihoods for each isochrone in the model set
     #
@@ -345,23 +536,82 @@ def bestFit(system, isochrone_brand, fit_using = 'mass', compare_to = [],
     maximum  = 0.
     i = 0
     row = i
-    for afe in afe_range:
-        for feh in feh_range:
-            for age in age_range:
-                #print "Working on:", age, feh, afe
-                iso = isochrone.Isochrone(age, feh, alpha_enhancement = afe,
-                                          brand = isochrone_brand)
-                resids = residuals(system, iso, independent = fit_using, 
-                                   compare_to = compare_to)
-                fit_data.append([age/1.e3, feh, afe, resids[4], resids[1][0][0],
-                                 resids[1][0][1], resids[1][0][2], resids[1][0][3]])
-                if resids[4] > maximum:
-                    maximum = resids[4]
-                    row = i
-                i += 1
-            #-- age loop
-        #-- Fe/H loop
-    #-- A/Fe loop
+    position = 0
+    
+    if checkpoint is not None:
+        ckpt_key = checkpointKey(system, isochrone_brand, fit_using, compare_to, nodes)
+        state    = loadCheckpoint(checkpoint, ckpt_key, nodes)
+        if state is not None:
+            fit_data = state['fit_data']
+            maximum  = state['maximum']
+            row      = state['row']
+            i        = state['i']
+            position = state['position']
+    
+    # only isochrones without a cached result need to be read
+    todo   = [(afe, feh, age, isochrone_brand) for afe, feh, age in nodes[position:]]
+    cached = set()
+    if cache is not None:
+        hits, misses = cache.hits, cache.misses
+        for node in todo:
+            iso = Isochrone(node[2], node[1], alpha_enhancement = node[0], 
+                            brand = isochrone_brand)
+            result_key = cache.key(system, iso, 'residuals', fit_using, list(compare_to))
+            if cache.contains(result_key):
+                cached.add(node)
+    
+    # isochrones are read ahead in the grid's scan order
+    isochrones = pf.IsochronePrefetcher(isochrone_brand, depth = prefetch,
+                                        nodes = [node[:3] for node in todo if node not in cached])
+    
+    def metrics():
+        """ Isochrones fit, I/O wait and cache use of this call """
+        values = {'nodes': i, 'io_wait': isochrones.io_wait}
+        if cache is not None:
+            values['cache_hits']   = cache.hits - hits
+            values['cache_misses'] = cache.misses - misses
+            lookups = values['cache_hits'] + values['cache_misses']
+            values['cache_hit_rate'] = values['cache_hits']/float(lookups) if lookups else 0.
+        return values
+    
+    progress = Progress(callback, 'bestFit', total = len(todo), unit = 'isochrones')
+    progress.start(**metrics())
+    loaded = iter(isochrones)
+    for node in todo:
+        if node in cached:
+            iso = Isochrone(node[2], node[1], alpha_enhancement = node[0], 
+                            brand = isochrone_brand)
+        else:
+            iso = next(loaded)
+        position += 1
+        if iso.exists:
+            resids = residuals(system, iso, independent = fit_using, 
+                               compare_to = compare_to, cache = cache, lazy = True)
+            fit_data.append([iso.age/1.e3, iso.Fe_H, iso.A_Fe, resids[4], resids[1][0][0],
+                             resids[1][0][1], resids[1][0][2], resids[1][0][3]])
+            if resids[4] > maximum:
+                maximum = resids[4]
+                row = i
+            i += 1
+        
+        if checkpoint is not None and position % checkpoint_every == 0:
+            saveCheckpoint(checkpoint, {'key': ckpt_key, 'position': position, 
+                                        'node': nodes[position - 1], 'fit_data': fit_data, 
+                                        'maximum': maximum, 'row': row, 'i': i})
+        progress.update(**metrics())
+    
+    if checkpoint is not None:
+        import os
+        if os.path.isfile(checkpoint):
+            os.remove(checkpoint)
+    
+    progress.finish(**metrics())
+    if stats is not None:
+        stats.update(metrics())
+    
+    if len(fit_data) == 0:
+        print 'ERROR: No {0} isochrones were found to fit.\n'.format(isochrone_brand)
+        return None
     
     if return_all:
         return row, fit_data
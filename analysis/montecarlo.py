@@ -0,0 +1,159 @@
+#
+#
+import copy
+import numpy as np
+
+__all__ = ['drawRealizations', 'monteCarloFit']
+
+
+def drawRealizations(system, N_draws, independent = 'mass', compare_to = [],
+                     correlations = {}, seed = None):
+    """ Observations of N_draws random realizations of one system
+
+        Every observed quantity of every star (independent variable,
+        compared properties and [Fe/H]) is perturbed by Gaussian noise
+        with its quoted uncertainty. Correlations between quantities of
+        the same star enter through the star's covariance matrix. The
+        realizations are packed into a single coeval.Observations object
+        in which each realization is a separate system, so they can all
+        be scored against an isochrone at once.
+
+        Required Arguments:
+        -------------------
+        system        ::  star, binary, or multiple system object.
+
+        N_draws       ::  number of realizations.
+
+        Optional Arguments:
+        -------------------
+        independent   ::  property used to locate stars on an isochrone.
+
+        compare_to    ::  properties compared against the isochrone.
+
+        correlations  ::  dictionary of correlation coefficients between
+                          pairs of quantities of a star, e.g.
+                          {('mass', 'radius'): 0.6}. [Fe/H] is '[Fe/H]'.
+
+        seed          ::  seed of the random number generator.
+
+        Returns:
+        --------
+        obs           ::  coeval.Observations object of the realizations.
+
+    """
+    from .coeval import Observations
+
+    base  = Observations([system], independent = independent, compare_to = compare_to)
+    names = [independent] + base.props + ['[Fe/H]']
+    stars = system.stars if system.N_components > 1 else [system]
+
+    # per-star values and uncertainties of every perturbed quantity
+    value = np.column_stack((base.indep, base.value, base.fe_h[:, 0]))
+    sigma = np.column_stack((np.array([star.properties[star.pdict[independent]][1]
+                                       for star in stars], dtype = float),
+                             base.sigma, base.fe_h[:, 1]))
+    sigma[~np.isfinite(sigma)] = 0.
+
+    rng  = np.random.RandomState(seed)
+    draw = np.empty((N_draws, len(stars), len(names)))
+    for i in range(len(stars)):
+        cov = np.diag(sigma[i]**2)
+        for (a, b), rho in correlations.items():
+            if a in names and b in names:
+                j, k = names.index(a), names.index(b)
+                cov[j, k] = cov[k, j] = rho*sigma[i, j]*sigma[i, k]
+        draw[:, i, :] = rng.multivariate_normal(value[i], cov, N_draws)
+    draw = draw.reshape(N_draws*len(stars), len(names))
+
+    obs = copy.copy(base)
+    obs.N_systems = N_draws
+    obs.system = np.repeat(np.arange(N_draws), len(stars))
+    obs.indep  = draw[:, 0]
+    obs.value  = draw[:, 1:-1]
+    obs.sigma  = np.tile(base.sigma, (N_draws, 1))
+    obs.lnorm  = np.tile(base.lnorm, (N_draws, 1))
+    obs.fe_h   = np.column_stack((draw[:, -1], np.tile(base.fe_h[:, 1], N_draws)))
+    obs.zx     = 10.**(obs.fe_h[:, 0] - 1.636)
+    obs.zx_err = np.tile(base.zx_err, N_draws)
+    return obs
+
+
+def monteCarloFit(system, isochrone_brand, N_draws = 10000, fit_using = 'mass',
+                  compare_to = [], correlations = {}, seed = None, callback = None):
+    """ Distribution of best fit isochrones over realizations of a system
+
+        N_draws realizations of the system's observables are drawn and
+        every isochrone of the model set is loaded once and scored against
+        all of them in a single vectorized likelihood evaluation. The best
+        fit isochrone of each realization is tracked as the grid is
+        scanned.
+
+        Required Arguments:
+        -------------------
+        system           ::  star, binary, or multiple system object.
+
+        isochrone_brand  ::  string of the particular model set.
+
+        Optional Arguments:
+        -------------------
+        N_draws          ::  number of realizations.
+
+        fit_using        ::  independent variable for fitting data to models.
+
+        compare_to       ::  variables to perform comparison over.
+
+        correlations     ::  correlation coefficients between quantities of
+                             a star (see drawRealizations).
+
+        seed             ::  seed of the random number generator.
+
+        callback         ::  function receiving progress events (see
+                             utils.progress.Progress).
+
+        Returns:
+        --------
+        summary          ::  dictionary with the mean, standard deviation
+                             and 16th, 50th and 84th percentiles of the best
+                             fit age (Myr) and [Fe/H].
+
+        draws            ::  array with one row per realization: best fit
+                             age (Myr), [Fe/H], [a/Fe] and log-likelihood.
+
+    """
+    from ..model import isochrone, manifest
+    from ..utils.progress import Progress
+    from .coeval import systemLogLikelihoods
+
+    obs = drawRealizations(system, N_draws, independent = fit_using,
+                           compare_to = compare_to, correlations = correlations,
+                           seed = seed)
+
+    draws = np.empty((N_draws, 4))
+    draws.fill(np.nan)
+    draws[:, 3] = -np.inf
+
+    nodes    = manifest.getManifest(isochrone_brand).isochroneNodes()
+    progress = Progress(callback, 'monteCarloFit', total = len(nodes),
+                        rates = {'stars': len(obs.indep)})
+    progress.start()
+    for afe, feh, age in nodes:
+        progress.update()
+        iso = isochrone.Isochrone(age, feh, alpha_enhancement = afe,
+                                  brand = isochrone_brand)
+        if not iso.exists:
+            continue
+        lnL    = systemLogLikelihoods(obs, iso, lazy = True)
+        better = lnL > draws[:, 3]
+        draws[better] = [age/1.e6, feh, afe, 0.]
+        draws[better, 3] = lnL[better]
+    progress.finish()
+
+    summary = {}
+    fit = np.isfinite(draws[:, 3])
+    for name, col in [('age', 0), ('feh', 1)]:
+        x = draws[fit, col]
+        if len(x) == 0:
+            summary[name] = None
+            continue
+        summary[name] = [np.mean(x), np.std(x)] + list(np.percentile(x, [16., 50., 84.]))
+    return summary, draws
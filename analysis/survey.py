@@ -0,0 +1,234 @@
+#
+#
+import time
+import itertools
+import numpy as np
+from ..utils.progress import Progress, printProgress
+
+__all__ = ['loadGridPoints', 'fitChunk', 'fitCatalog']
+
+# properties compared in log space
+log_props = ['teff', 'luminosity', 'radius', 'mass']
+
+
+def loadGridPoints(isochrone_brand, properties, mass_grid_space = 0.005):
+    """ Tabulate every isochrone of a model set on a dense mass grid
+
+        As in isofit.resids, each isochrone is interpolated onto masses
+        spaced by mass_grid_space. Points of all isochrones are stacked
+        into a single array.
+
+        Required Arguments:
+        -------------------
+        isochrone_brand  ::  string of the particular model set.
+
+        properties       ::  isochrone columns to tabulate.
+
+        Optional Arguments:
+        -------------------
+        mass_grid_space  ::  mass spacing along each isochrone.
+
+        Returns:
+        --------
+        nodes            ::  array of [age, [Fe/H], [a/Fe]] of each isochrone.
+
+        points           ::  array of tabulated properties, one row per point
+                             (log10 for teff, luminosity, radius and mass),
+                             in the storage type set in defs.
+
+        masses           ::  mass of each point.
+
+        owner            ::  row in nodes of the isochrone of each point.
+
+    """
+    from ..model import isochrone, manifest, defs
+
+    nodes, points, masses, owner = [], [], [], []
+    for afe, feh, age in manifest.getManifest(isochrone_brand).isochroneNodes():
+        iso = isochrone.Isochrone(age, feh, alpha_enhancement = afe,
+                                  brand = isochrone_brand)
+        iso.loadIsochrone(lazy = True)
+        if not iso.is_loaded:
+            continue
+        mass_r = iso.col('mass')
+        order  = np.argsort(mass_r)
+        mass   = np.arange(mass_r[order[0]], mass_r[order[-1]], mass_grid_space)
+
+        tab = np.empty((len(mass), len(properties)), dtype = defs.getStorageDtype())
+        for j, prop in enumerate(properties):
+            tab[:, j] = np.interp(mass, mass_r[order], iso.col(prop)[order])
+            if prop in log_props:
+                tab[:, j] = np.log10(tab[:, j])
+
+        owner.append(np.repeat(len(nodes), len(mass)))
+        nodes.append([age, feh, afe])
+        points.append(tab)
+        masses.append(mass)
+
+    return (np.array(nodes), np.concatenate(points), np.concatenate(masses),
+            np.concatenate(owner))
+
+
+def fitChunk(value, sigma, tree, scale, points, masses, owner, nodes, k = 32):
+    """ Fit a chunk of stars against a tabulated model grid
+
+        Candidate model points are found for all stars at once by a k-nearest
+        neighbor query in a scaled property space. The chi^2 of each star
+        against its candidates is then computed exactly using the star's own
+        uncertainties. Summary statistics are weighted by exp(-chi^2/2) over
+        the candidates.
+
+        Required Arguments:
+        -------------------
+        value, sigma  ::  arrays of observed properties and uncertainties
+                          (in the same space as points), one row per star.
+
+        tree          ::  scipy.spatial.cKDTree of grid points divided
+                          by scale.
+
+        scale         ::  scale of each property in the tree.
+
+        points, masses, owner, nodes  ::  grid from loadGridPoints().
+
+        Optional Arguments:
+        -------------------
+        k             ::  number of candidate points per star.
+
+        Returns:
+        --------
+        results       ::  array with one row per star: age (Myr), [Fe/H],
+                          [a/Fe], mass and chi^2 of the best point, then the
+                          weighted mean and standard deviation of log age
+                          and mass.
+
+    """
+    results = np.empty((len(value), 9))
+    results.fill(np.nan)
+    good = np.all(np.isfinite(value), axis = 1) & np.all(sigma > 0., axis = 1)
+    if not np.any(good):
+        return results
+
+    k = min(k, len(points))
+    dist, cand = tree.query(value[good]/scale, k = k)
+    cand = cand.reshape(len(cand), -1)
+
+    chi2 = np.sum(((value[good, np.newaxis, :] - points[cand])/
+                   sigma[good, np.newaxis, :])**2, axis = 2)
+    best = np.argmin(chi2, axis = 1)
+    rows = np.arange(len(cand))
+    bpt  = cand[rows, best]
+
+    w = np.exp(-0.5*(chi2 - chi2[rows, best][:, np.newaxis]))
+    w = w/np.sum(w, axis = 1)[:, np.newaxis]
+    logage = np.log10(nodes[owner[cand], 0])
+    mass   = masses[cand]
+    mean_age  = np.sum(w*logage, axis = 1)
+    mean_mass = np.sum(w*mass, axis = 1)
+
+    results[good, 0] = nodes[owner[bpt], 0]/1.e6
+    results[good, 1] = nodes[owner[bpt], 1]
+    results[good, 2] = nodes[owner[bpt], 2]
+    results[good, 3] = masses[bpt]
+    results[good, 4] = chi2[rows, best]
+    results[good, 5] = mean_age
+    results[good, 6] = np.sqrt(np.sum(w*(logage - mean_age[:, np.newaxis])**2, axis = 1))
+    results[good, 7] = mean_mass
+    results[good, 8] = np.sqrt(np.sum(w*(mass - mean_mass[:, np.newaxis])**2, axis = 1))
+    return results
+
+
+def fitCatalog(catalog, output, isochrone_brand, columns, chunk_size = 100000,
+               k = 32, mass_grid_space = 0.005, callback = printProgress):
+    """ Fit a large catalog of stars against a model set, chunk by chunk
+
+        The catalog is streamed in chunks of chunk_size rows. Each chunk is
+        fit against the full model grid, which is tabulated once, and the
+        per-star results are appended to the output file before the next
+        chunk is read. Peak memory therefore depends on the chunk size and
+        the grid, not on the length of the catalog.
+
+        Required Arguments:
+        -------------------
+        catalog          ::  whitespace delimited text file (may be
+                             compressed), one star per row. Lines starting
+                             with '#' are ignored.
+
+        output           ::  location of the output file.
+
+        isochrone_brand  ::  string of the particular model set.
+
+        columns          ::  dictionary mapping isochrone properties to the
+                             catalog columns holding their (value, error),
+                             e.g. {'teff': (1, 2), 'luminosity': (3, 4)}.
+
+        Optional Arguments:
+        -------------------
+        chunk_size       ::  number of catalog rows fit at once.
+
+        k                ::  number of candidate grid points per star.
+
+        mass_grid_space  ::  mass spacing along each isochrone.
+
+        callback         ::  function receiving progress events after each
+                             chunk (see utils.progress.Progress). By default
+                             a line is printed per chunk; None is silent.
+
+        Returns:
+        --------
+        stats            ::  dictionary with the number of stars, the time
+                             spent (s) and the throughput (stars per second).
+
+    """
+    from scipy.spatial import cKDTree
+    from ..model import readers
+    from ..utils.compress import openFile
+
+    start = time.time()
+    progress = Progress(callback, 'fitCatalog', unit = 'stars')
+    progress.start()
+    props   = sorted(columns)
+    usecols = [columns[p][0] for p in props] + [columns[p][1] for p in props]
+    nodes, points, masses, owner = loadGridPoints(isochrone_brand, props,
+                                                  mass_grid_space = mass_grid_space)
+
+    # neighbor search in a space where each property has unit spread
+    scale = np.std(points, axis = 0)
+    scale[scale == 0.] = 1.
+    tree  = cKDTree(points/scale)
+
+    fout = open(output, 'w')
+    fout.write('#{:>9s}{:>11s}{:>11s}{:>11s}{:>11s}{:>11s}{:>11s}{:>11s}{:>11s}{:>11s}\n'.format(
+               'row', 'age', '[Fe/H]', '[a/Fe]', 'mass', 'chi2', 'logage', 'e_logage',
+               'mass_wt', 'e_mass_wt'))
+
+    fin = openFile(catalog)
+    N_stars = 0
+    while True:
+        lines = list(itertools.islice(fin, chunk_size))
+        if len(lines) == 0:
+            break
+        data = readers.parseTable(lines, usecols = usecols)
+        if len(data) == 0:
+            continue
+
+        value = data[:, :len(props)]
+        sigma = data[:, len(props):]
+        with np.errstate(invalid = 'ignore', divide = 'ignore'):
+            for j, prop in enumerate(props):
+                if prop in log_props:
+                    sigma[:, j] = sigma[:, j]/(value[:, j]*np.log(10.))
+                    value[:, j] = np.log10(value[:, j])
+
+        results = fitChunk(value, sigma, tree, scale, points, masses, owner, nodes, k = k)
+        rows    = np.arange(N_stars, N_stars + len(data))
+        fout.write(readers.formatTable(np.column_stack((rows, results)), fmt = '%10.4f'))
+        fout.flush()
+
+        N_stars += len(data)
+        progress.update(len(data))
+    fin.close()
+    fout.close()
+    progress.finish()
+
+    elapsed = time.time() - start
+    return {'stars': N_stars, 'time': elapsed, 'stars_per_second': N_stars/elapsed}
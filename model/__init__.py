@@ -3,4 +3,5 @@
 from isochrone import *
 from masstrack import *
 
-__all__ = ['isochrone', 'masstrack', 'isogen']
+__all__ = ['isochrone', 'masstrack', 'isogen', 'bolcorr', 'population',
+           'sharedgrid', 'prefetch', 'manifest', 'readers', 'cube', 'isoset']
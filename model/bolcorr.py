@@ -0,0 +1,247 @@
+#
+#
+import os
+import numpy as np
+from . import defs
+
+__all__ = ['BCTable', 'getBCTable', 'transform']
+
+# solar absolute bolometric magnitude and constants for derived log(g)
+Mbol_sun = 4.74
+GMsun    = 1.32712440041e26
+Rsun     = 6.956e10
+
+# bolometric correction tables already read into memory, keyed by system
+_tables  = {}
+
+class BCTable(object):
+
+    def __init__(self, filepath):
+        """ Bolometric correction table on a regular (Teff, logg, [Fe/H], [a/Fe]) grid
+
+            The table is read from an ASCII file whose last comment line
+            labels the columns: Teff, log(g), [Fe/H], [a/Fe], followed by
+            one column for each photometric passband. Once parsed, the
+            table is written to a binary cache (.npz) next to the ASCII
+            file so that subsequent loads skip the slow text parsing. The
+            cache is refreshed whenever the ASCII table is newer.
+
+            Required Arguments:
+            -------------------
+            filepath  ::  location of the ASCII bolometric correction table.
+
+            Returns:
+            --------
+            BCTable object.
+
+        """
+        self.filepath  = filepath
+        self.cachepath = os.path.splitext(filepath)[0] + '.npz'
+
+        if self.cacheIsCurrent():
+            self.loadCache()
+        else:
+            self.loadTable()
+            self.writeCache()
+        self.buildInterpolator()
+
+
+    def cacheIsCurrent(self):
+        """ Check whether the binary cache exists and is up to date """
+        try:
+            return os.path.getmtime(self.cachepath) >= os.path.getmtime(self.filepath)
+        except OSError:
+            return False
+
+
+    def loadTable(self):
+        """ Parse ASCII table and place it on a regular grid """
+        labels = []
+        fin = open(self.filepath)
+        for line in fin:
+            if line[0] == '#':
+                labels = line[1:].split()
+            elif line.strip():
+                break
+        fin.close()
+        self.filters = labels[4:]
+
+        data = np.loadtxt(self.filepath, comments = '#')
+
+        # grid axes (log Teff is better behaved for interpolation)
+        data[:, 0] = np.log10(data[:, 0])
+        self.axes  = [np.unique(data[:, i]) for i in range(4)]
+
+        # nodes absent from the table are flagged with NaN
+        shape = [len(axis) for axis in self.axes] + [len(self.filters)]
+        self.bc_grid = np.empty(shape)
+        self.bc_grid.fill(np.nan)
+        index = tuple(np.searchsorted(self.axes[i], data[:, i]) for i in range(4))
+        self.bc_grid[index] = data[:, 4:]
+
+
+    def loadCache(self):
+        """ Load table from binary cache """
+        cache = np.load(self.cachepath)
+        self.filters = [str(x) for x in cache['filters']]
+        self.axes    = [cache['axis{:1.0f}'.format(i)] for i in range(4)]
+        self.bc_grid = cache['bc_grid']
+        cache.close()
+
+
+    def writeCache(self):
+        """ Write table to binary cache, if the directory is writable """
+        axes = dict(('axis{:1.0f}'.format(i), self.axes[i]) for i in range(4))
+        try:
+            np.savez(self.cachepath, filters = np.array(self.filters),
+                     bc_grid = self.bc_grid, **axes)
+        except (IOError, OSError):
+            print 'WARNING: Unable to write BC cache {0}.\n'.format(self.cachepath)
+
+
+    def buildInterpolator(self):
+        """ Build interpolant over all non-degenerate table axes """
+        from scipy.interpolate import RegularGridInterpolator
+
+        # axes with a single node cannot be interpolated and are dropped
+        self.active = [i for i in range(4) if len(self.axes[i]) > 1]
+        shape  = [len(self.axes[i]) for i in self.active] + [len(self.filters)]
+        self.interpolant = RegularGridInterpolator([self.axes[i] for i in self.active],
+                                                   self.bc_grid.reshape(shape),
+                                                   bounds_error = False,
+                                                   fill_value = np.nan)
+
+
+    def interpolate(self, teff, logg, feh, afe):
+        """ Interpolate bolometric corrections for arrays of stellar properties
+
+            Required Arguments:
+            -------------------
+            teff  ::  effective temperatures (in K).
+
+            logg  ::  surface gravities (in cgs).
+
+            feh   ::  [Fe/H] (in dex), scalar or one value per star.
+
+            afe   ::  [a/Fe] (in dex), scalar or one value per star.
+
+            Returns:
+            --------
+            bc    ::  array of bolometric corrections, one row per star and
+                      one column per filter. Points outside of the table are
+                      returned as NaN.
+
+        """
+        teff   = np.asarray(teff, dtype = float)
+        points = [np.log10(teff), logg, feh, afe]
+        points = np.column_stack([np.broadcast_to(points[i], teff.shape)
+                                  for i in self.active])
+        return self.interpolant(points)
+
+
+def getBCTable(system = 'UBVRIJHK'):
+    """ Get bolometric correction table, reading it only on first request """
+    if system not in _tables:
+        _tables[system] = BCTable(defs.getBCTablePath(system))
+    return _tables[system]
+
+
+def isochroneProperties(iso):
+    """ Return linear Teff, luminosity, and log(g) along an isochrone """
+    data   = iso.isochrone
+    logged = [] if iso.unlogged else defs.getLoggedQuantities(iso.brand)
+
+    props = {}
+    for prop in ['teff', 'luminosity', 'radius', 'mass', 'logg']:
+        if prop not in iso.column:
+            continue
+        props[prop] = data[:, iso.column[prop]]
+        if prop in logged:
+            props[prop] = 10.0**props[prop]
+
+    # derive surface gravity when the isochrone only provides a radius
+    if 'logg' not in props:
+        props['logg'] = np.log10(GMsun*props['mass']/(props['radius']*Rsun)**2)
+    return props['teff'], props['luminosity'], props['logg']
+
+
+def transform(isochrones, system = 'UBVRIJHK'):
+    """ Perform color-Teff transformation for one or more isochrones
+
+        Bolometric corrections are interpolated in the requested table
+        for all points on all isochrones in a single vectorized call.
+        Absolute magnitudes are appended as new columns to each isochrone
+        and the column dictionary of each isochrone is updated with the
+        new entries (e.g., 'Mv', 'Mk'). For brands with a magnitude layout
+        in defs.mag_layout, the columns follow that layout, so files
+        written afterwards are read back with defs.iso_column; passbands
+        missing from the table are NaN.
+
+        Required Arguments:
+        -------------------
+        isochrones  ::  isochrone object or list of isochrone objects.
+
+        Optional Arguments:
+        -------------------
+        system      ::  photometric system listed in defs.bc_tables.
+
+        Returns:
+        --------
+        None. Magnitudes are stored in each isochrone's 'magnitudes' and
+        'isochrone' properties.
+
+    """
+    if not isinstance(isochrones, (list, tuple)):
+        isochrones = [isochrones]
+    table = getBCTable(system)
+
+    # stack properties of all isochrones into contiguous arrays
+    teff, lumi, logg, feh, afe = [], [], [], [], []
+    for iso in isochrones:
+        T, L, g = isochroneProperties(iso)
+        teff.append(T)
+        lumi.append(L)
+        logg.append(g)
+        feh.append(np.repeat(iso.Fe_H, len(T)))
+        afe.append(np.repeat(iso.A_Fe, len(T)))
+    bounds = np.cumsum([0] + [len(T) for T in teff])
+
+    mbol = Mbol_sun - 2.5*np.log10(np.concatenate(lumi))
+    mags = mbol[:, np.newaxis] - table.interpolate(np.concatenate(teff),
+                                                   np.concatenate(logg),
+                                                   np.concatenate(feh),
+                                                   np.concatenate(afe))
+
+    # split magnitudes back onto the individual isochrones
+    for i, iso in enumerate(isochrones):
+        iso.magnitudes = mags[bounds[i]:bounds[i + 1]]
+        filters = magnitudeLayout(iso, table.filters)
+        N = iso.isochrone.shape[1]
+        columns = np.empty((len(iso.magnitudes), len(filters)))
+        columns.fill(np.nan)
+        for j, f in enumerate(filters):
+            if f in table.filters:
+                columns[:, j] = iso.magnitudes[:, table.filters.index(f)]
+            # repeated passbands are named after their last column, as in iso_column
+            iso.column['M' + f.lower()] = N + j
+        iso.isochrone = np.column_stack((iso.isochrone, columns))
+        iso.addMagsToHeader(filters)
+
+
+def magnitudeLayout(iso, filters):
+    """ Passbands of the magnitude columns appended to an isochrone
+
+        The brand's layout in defs.mag_layout is used when the isochrone
+        ends where the layout's magnitude columns begin in iso_column;
+        otherwise the table's passbands are appended in table order.
+    """
+    layout = defs.getMagLayout(iso.brand)
+    if layout is None:
+        return list(filters)
+    name  = 'M' + layout[-1].lower()
+    start = defs.getIsochroneCols(iso.brand)[name] - (len(layout) - 1)
+    if iso.isochrone.shape[1] != start:
+        print 'WARNING: {0} isochrone has {1} columns, expected {2}; magnitude columns '\
+              'will not match defs.iso_column.\n'.format(iso.brand, iso.isochrone.shape[1], start)
+        return list(filters)
+    return list(layout)
@@ -0,0 +1,160 @@
+#
+#
+import json
+import numpy as np
+from . import defs
+
+__all__ = ['ModelCube', 'buildModelCube']
+
+class ModelCube(object):
+
+    def __init__(self, filepath, mmap_mode = 'r'):
+        """ Dense (afe, feh, age, point, property) array of a resampled model grid
+
+            The cube is stored as a .npy file, which is memory-mapped when
+            loaded, alongside a .json file describing its axes. Grid nodes
+            without an isochrone and points outside of an isochrone's
+            range are NaN.
+
+            Required Arguments:
+            -------------------
+            filepath   ::  location of the cube (.npy) file.
+
+            Optional Arguments:
+            -------------------
+            mmap_mode  ::  numpy memory-map mode, or None to read the cube
+                           fully into memory.
+
+            Returns:
+            --------
+            ModelCube object.
+
+        """
+        from ..utils.compress import openFile
+
+        self.filepath = filepath
+        fin  = openFile(metaPath(filepath))
+        meta = json.load(fin)
+        fin.close()
+
+        self.brand      = meta['brand']
+        self.axis       = meta['axis']
+        self.properties = meta['properties']
+        self.afe        = np.array(meta['afe'])
+        self.feh        = np.array(meta['feh'])
+        self.ages       = np.array(meta['ages'])
+        self.points     = np.array(meta['points'])
+        self.cube       = np.load(filepath, mmap_mode = mmap_mode)
+
+
+    def index(self, age, feh, afe = 0.0):
+        """ Indices of a grid node in the cube """
+        return (int(np.argmin(abs(self.afe - afe))), int(np.argmin(abs(self.feh - feh))),
+                int(np.argmin(abs(self.ages - age))))
+
+
+    def node(self, age, feh, afe = 0.0):
+        """ Resampled isochrone at a grid node, shape (points, properties) """
+        return self.cube[self.index(age, feh, afe)]
+
+
+    def prop(self, name):
+        """ Sub-cube of a single property, shape (afe, feh, age, points) """
+        return self.cube[..., self.properties.index(name)]
+
+
+    def mask(self):
+        """ Boolean array flagging populated (afe, feh, age, point) cells """
+        return np.isfinite(self.cube[..., 0])
+
+
+def metaPath(filepath):
+    """ Location of the axis description of a cube file """
+    return filepath[:-4] + '.json' if filepath.endswith('.npy') else filepath + '.json'
+
+
+def buildModelCube(brand, filepath = None, properties = ['teff', 'luminosity', 'radius', 'logg'],
+                   axis = 'mass', points = None, N_points = 500, dtype = None):
+    """ Resample every isochrone of a brand onto a common axis
+
+        Each isochrone is linearly interpolated onto a common set of masses
+        (or EEPs) and written into a dense, memory-mapped array of shape
+        (afe, feh, age, points, properties). Isochrones are processed one
+        at a time, so the cube never has to fit in memory while building.
+
+        Required Arguments:
+        -------------------
+        brand       ::  modeling group.
+
+        Optional Arguments:
+        -------------------
+        filepath    ::  location of the cube file. Defaults to
+                        '{brand}_{axis}_cube.npy' in the model directory.
+
+        properties  ::  isochrone columns stored in the cube.
+
+        axis        ::  isochrone column used as the common axis ('mass'
+                        or, for brands providing it, 'eep').
+
+        points      ::  values of the common axis. Defaults to N_points
+                        evenly spaced masses spanning the brand's mass
+                        range, or EEPs 0 to N_points - 1.
+
+        N_points    ::  number of default axis points.
+
+        dtype       ::  storage data type, np.float32 or np.float64.
+                        Defaults to the storage type set in defs.
+
+        Returns:
+        --------
+        ModelCube object, memory-mapped read-only.
+
+    """
+    from .isochrone import Isochrone
+    from .manifest import getManifest
+
+    if dtype is None:
+        dtype = defs.getStorageDtype()
+    if filepath is None:
+        filepath = '{0}/{1}_{2}_cube.npy'.format(defs.getModelDirectory(brand), brand, axis)
+    if points is None:
+        if axis == 'mass':
+            mass_range = defs.getMassRange(brand)
+            points = np.linspace(min(mass_range), max(mass_range), N_points)
+        else:
+            points = np.arange(N_points, dtype = float)
+    points = np.asarray(points, dtype = float)
+
+    afe_range = list(defs.getAFeRange(brand))
+    feh_range = list(defs.getFeHRange(brand))
+    age_range = list(defs.getAgeRange(brand))
+
+    cube = np.lib.format.open_memmap(filepath, mode = 'w+', dtype = dtype,
+                                     shape = (len(afe_range), len(feh_range),
+                                              len(age_range), len(points),
+                                              len(properties)))
+    cube[:] = np.nan
+
+    for afe, feh, age in getManifest(brand).isochroneNodes():
+        iso = Isochrone(age, feh, alpha_enhancement = afe, brand = brand)
+        iso.loadIsochrone(lazy = True)
+        if not iso.is_loaded:
+            continue
+        x     = iso.col(axis)
+        order = np.argsort(x)
+        cell  = cube[afe_range.index(afe), feh_range.index(feh), age_range.index(age)]
+        for k, prop in enumerate(properties):
+            if iso.hasColumn(prop):
+                cell[:, k] = np.interp(points, x[order], iso.col(prop)[order],
+                                       left = np.nan, right = np.nan)
+    cube.flush()
+    del cube
+
+    meta = {'brand': brand, 'axis': axis, 'properties': list(properties),
+            'afe': afe_range, 'feh': feh_range, 'ages': [float(a) for a in age_range],
+            'points': points.tolist()}
+    fout = open(metaPath(filepath), 'w')
+    json.dump(meta, fout)
+    fout.close()
+
+    return ModelCube(filepath)
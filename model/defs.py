@@ -1,7 +1,8 @@
 # 
 #
 __all__ = ['plusMinus', 'getModelDirectory', 'getAgeRange', 'getMassRange',
-           'getFeHRange', 'getAFeRange', 'getIsochroneCols', 'getLoggedQuantities']
+           'getFeHRange', 'getAFeRange', 'getIsochroneCols', 'getLoggedQuantities',
+           'getBCTablePath', 'getIsochroneGrid', 'getStorageDtype', 'setStorageDtype']
 
 # Dictionaries and data associated with various stellar evolution models
 shell_env  = {'BAton'    : 'ATON_MODEL_PATH',
@@ -14,6 +15,11 @@ shell_env  = {'BAton'    : 'ATON_MODEL_PATH',
               'Yale'     : 'YALE_MODEL_PATH'
              }
 
+# bolometric correction tables, keyed by photometric system
+bc_env     = 'BCOR_TABLE_PATH'
+
+bc_tables  = {'UBVRIJHK': 'bc_ubvrijhk.dat'}
+
 age_range  = {'Dartmouth': (1.0e9, 13.0e9, 2.5e8), 
               'DMESTAR'  : (1.0e6, 20.1e6, 1.0e5),
               'DSEP08'   : (1.0e6, 1.0e9),
@@ -106,6 +112,10 @@ iso_column = {'BAton'    : {'mass': 0, 'luminosity': 1, 'teff': 2, 'logg': 3},
                             'teff': 4}
              }
               
+# passbands of the magnitude columns written after the model columns of a
+# transformed isochrone, matching the magnitude positions in iso_column
+mag_layout = {'Dartmouth': ['B', 'V', 'R', 'I', 'V', 'I', 'J', 'H', 'K']}
+
 log_values = {'BAton'    : ['teff', 'luminosity'],
               'Dartmouth': ['teff', 'radius', 'luminosity'],
               'DMESTAR'  : ['teff', 'radius', 'luminosity'],
@@ -126,6 +136,11 @@ pisaZMap   = {-1.80: 0.0002, -1.10: 0.0010, -0.80: 0.0020, -0.60: 0.0030,
                0.10: 0.0150,  0.20: 0.0175,  0.25: 0.0200,  0.30: 0.0225,
                0.35: 0.0250,  0.40: 0.0275,  0.45: 0.0300}
 
+# data type of model data held in memory, caches and cubes. Likelihoods
+# are always accumulated in double precision.
+storage_dtype = 'float64'
+storage_dtypes = ['float32', 'float64']
+
 
 def plusMinus(x):
     """ Determine whether value is positive (p) or negative (m) 
@@ -197,6 +212,9 @@ def getAgeRange(brand):
     elif brand in ['Yale', 'Yale13', 'BAton']:
         ages = arange(1.0e6, 2.0e7, 2.0e5)
         ages = append(ages, arange(2.0e7, 1.0e8, 5.0e6))
+    elif brand in age_range and len(age_range[brand]) == 3:
+        age_min, age_max, delta = age_range[brand]
+        ages = arange(age_min, age_max + 0.5*delta, delta)
     else:
         ages = 0.0
         
@@ -213,6 +231,28 @@ def getAFeRange(brand):
     return afe_range[brand]
 
 
+def getIsochroneGrid(brand):
+    """ Get (afe, feh, age) nodes of the isochrone grid in scan order 
+    
+        Nodes are ordered with age varying fastest, then [Fe/H], then
+        [a/Fe], which is the order in which isochrones are visited when
+        fitting over a full model set.
+        
+        Required Arguments:
+        -------------------
+        brand  ::  modeling group.
+        
+        
+        Returns:
+        --------
+        nodes  ::  list of (afe, feh, age) tuples.
+    
+    """
+    return [(afe, feh, age) for afe in getAFeRange(brand)
+                            for feh in getFeHRange(brand)
+                            for age in getAgeRange(brand)]
+
+
 def getModelDirectory(brand):
     """ Get shell environment variable for a given model brand """
     from os import getenv
@@ -224,4 +264,35 @@ def getIsochroneCols(brand):
 
 
 def getLoggedQuantities(brand):
-    return log_values[brand]
\ No newline at end of file
+    return log_values[brand]
+
+
+def getMagLayout(brand):
+    """ Passbands of the magnitude columns of transformed isochrones, or None """
+    return mag_layout.get(brand)
+
+
+def getBCTablePath(system = 'UBVRIJHK'):
+    """ Get location of bolometric correction table for a photometric system """
+    from os import getenv
+    return '{0}/{1}'.format(getenv(bc_env), bc_tables[system])
+
+
+def getStorageDtype():
+    """ Get data type used to store model data (a numpy dtype name) """
+    return storage_dtype
+
+
+def setStorageDtype(dtype = 'float64'):
+    """ Set data type used to store model data, 'float32' or 'float64' 
+    
+        Single precision halves the memory held by loaded isochrones, shared
+        grids and model cubes. Isochrones loaded before the change keep 
+        their data type.
+    """
+    global storage_dtype
+    name = getattr(dtype, '__name__', str(dtype))
+    if name not in storage_dtypes:
+        print 'ERROR: Storage data type must be one of {0}.\n'.format(storage_dtypes)
+        return
+    storage_dtype = name
@@ -2,6 +2,14 @@
 #
 import numpy as np
 from . import defs
+from . import manifest
+from . import readers
+
+# cgs constants of the derived columns
+GMsun = 1.32712440041e26
+Rsun  = 6.956e10
+Lsun  = 3.839e33
+sig   = 5.6704e-5
 
 class Isochrone(object):
     
@@ -47,6 +55,8 @@ class Isochrone(object):
                      
         """
         self.is_loaded = False
+        self.unlogged  = False
+        self.derived   = {}
         
         # isochrone properties
         if age < 1.e6:
@@ -56,7 +66,7 @@ class Isochrone(object):
         self.Fe_H    = metallicity
         self.A_Fe    = alpha_enhancement
         self.brand   = brand        
-        self.column  = defs.getIsochroneCols(self.brand)
+        self.column  = dict(defs.getIsochroneCols(self.brand))
         
         # locate isochrone directory
         iso_directory  = defs.getModelDirectory(brand)
@@ -132,21 +142,19 @@ class Isochrone(object):
                   
         self.filepath  = '{0}/{1}'.format(self.directory, self.filename)
         
-        # check if isochrone file exists
-        try:
-            open(self.filepath)
-            self.exists = True
-        except:
-            self.exists = False
+        # check if isochrone file exists (uses the brand's manifest if loaded)
+        self.exists = manifest.fileExists(self.brand, self.filepath)
     
     
-    def loadIsochrone(self):
+    def loadIsochrone(self, lazy = False):
         """ Load isochrone from file 
         
             This routine loads numerical data from the specified isochrone 
-            file. Header information is read using readIsochroneHeader() 
-            and is saved in a variable separate from the rest of the isochrone 
-            information.
+            file using the brand's reader in readers.py. Compressed files
+            (.gz, .bz2, .xz) are decompressed on the fly. Only columns listed
+            in defs.iso_column are kept. Header information is read in the 
+            same pass and is saved in a variable separate from the rest of 
+            the isochrone information.
             
             Required Arguments:
             -------------------
@@ -155,7 +163,9 @@ class Isochrone(object):
             
             Optional Arguments:
             -------------------
-            None
+            lazy  ::  keep the columns as stored in the file, without
+                      unlogging them or adding a radius column. Values are
+                      then read with col(), which derives them on first use.
             
             
             Returns:
@@ -166,47 +176,134 @@ class Isochrone(object):
         if self.exists == False:
             print '\nIsochrone does not exist. Please create a new isochrone.\n'
         else:
+            # isochrones with no radius get a spare column for a derived radius
+            derive = not lazy and self.brand in ['DSEP', 'DSEP08', 'Lyon10', 'BAton', 'Pisa']
             try:
-                self.loadIsochroneHeader()
-                self.isochrone = np.genfromtxt(self.filepath, comments = '#', 
-                                               skiprows = self.comm_rows)
+                self.isochrone, self.column, self.header = readers.readIsochrone(self,
+                                                               extra = int(derive))
+                self.header_loaded = True
                 self.is_loaded = True
-                self.unlogColumns()
-            except TypeError:
+                self.unlogged  = False
+                self.derived   = {}
+                if not lazy:
+                    self.unlogColumns()
+            except (TypeError, ValueError, IndexError, IOError):
                 print 'ERROR: Isochrone load failed.\n'
                 self.is_loaded = False
+                return
             
-            # for isochrones with no radius, only logg, create a radius column
-            GMsun = 1.32712440041e26
-            Rsun  = 6.956e10
-            Lsun  = 3.839e33
-            sig   = 5.6704e-5
-            if self.brand in ['DSEP', 'DSEP08', 'Lyon10', 'BAton']:
-                m_indx = self.column['mass']
-                g_indx = self.column['logg']
-                radius = np.sqrt(GMsun*self.isochrone[:,m_indx]/10.0**self.isochrone[:,g_indx])/Rsun
-                self.isochrone = np.column_stack((self.isochrone, radius))
-                self.column['radius'] = len(self.isochrone[0]) - 1
-            elif self.brand in ['Pisa']:
-                T_indx = self.column['teff']
-                L_indx = self.column['luminosity']
-                
-                # get radius from Stefan-Boltzmann Law
-                radius = np.sqrt(self.isochrone[:,L_indx]*Lsun / 
-                           (4.0*np.pi*sig*(self.isochrone[:,T_indx])**4))/Rsun
-                self.isochrone = np.column_stack((self.isochrone, radius))
+            # for isochrones with no radius, create a radius column from
+            # logg (or the Stefan-Boltzmann law for Pisa)
+            if derive:
+                self.isochrone[:, -1] = self.col('radius')
                 self.column['radius'] = len(self.isochrone[0]) - 1
-            else:
-                pass
+                self.derived.pop('radius')
                 
+    def col(self, name):
+        """ Values of an isochrone column, derived on first use if needed
+        
+            Columns are returned unlogged whether or not the isochrone has
+            been unlogged. Quantities the file does not provide are derived
+            and kept for later calls, without changing the isochrone array:
+            
+              radius    ::  from logg and mass, or from the Stefan-Boltzmann
+                            law.
+              logg      ::  from mass and radius.
+              log_<x>   ::  log10 of column x (read directly if x is stored
+                            logged).
+            
+            Derived values are computed in double precision. Unlogged
+            values and derived radii are then rounded to the data type of
+            the isochrone array, as they are stored when loading eagerly,
+            so that results do not depend on how the isochrone was loaded.
+            
+            Required Arguments:
+            -------------------
+            name  ::  column name.
+            
+            Returns:
+            --------
+            Array of the column values. Raises KeyError if the column can
+            not be provided.
+            
+        """
+        if name in self.derived:
+            return self.derived[name]
+        logged = [] if self.unlogged else defs.getLoggedQuantities(self.brand)
+        
+        if name in self.column:
+            values = self.isochrone[:, self.column[name]]
+            if name not in logged:
+                return values
+            values = 10.0**np.asarray(values, dtype = np.float64)
+            values = values.astype(self.isochrone.dtype)
+        elif name.startswith('log_'):
+            prop = name[4:]
+            if prop in self.column and prop in logged:
+                return self.isochrone[:, self.column[prop]]
+            values = np.log10(np.asarray(self.col(prop), dtype = np.float64))
+        elif name == 'radius' and 'logg' in self.column:
+            mass   = np.asarray(self.col('mass'), dtype = np.float64)
+            logg   = np.asarray(self.col('logg'), dtype = np.float64)
+            values = np.sqrt(GMsun*mass/10.0**logg)/Rsun
+            values = values.astype(self.isochrone.dtype)
+        elif name == 'radius' and 'teff' in self.column and 'luminosity' in self.column:
+            lumin  = np.asarray(self.col('luminosity'), dtype = np.float64)
+            teff   = np.asarray(self.col('teff'), dtype = np.float64)
+            values = np.sqrt(lumin*Lsun/(4.0*np.pi*sig*teff**4))/Rsun
+            values = values.astype(self.isochrone.dtype)
+        elif name == 'logg' and 'mass' in self.column:
+            mass   = np.asarray(self.col('mass'), dtype = np.float64)
+            radius = np.asarray(self.col('radius'), dtype = np.float64)
+            values = np.log10(GMsun*mass/(radius*Rsun)**2)
+        else:
+            raise KeyError(name)
+        self.derived[name] = values
+        return values
+    
+    
+    def hasColumn(self, name):
+        """ Whether col() can provide a column """
+        try:
+            self.col(name)
+        except KeyError:
+            return False
+        return True
+    
+    
+    def attachShared(self, descriptor):
+        """ Attach isochrone data held in a shared grid
+
+            Instead of reading the isochrone file, the isochrone array is
+            set to a read-only view into a grid hosted with
+            sharedgrid.hostGrid(). No data are copied, so any number of
+            worker processes may attach to the same grid.
+
+            Required Arguments:
+            -------------------
+            descriptor  ::  GridDescriptor of the hosted grid.
+
+        """
+        self.isochrone = descriptor.attach(self.age, self.Fe_H, self.A_Fe)
+        self.column    = dict(descriptor.columns)
+        self.header    = []
+        self.is_loaded = True
+        self.unlogged  = True
+        self.derived   = {}
+
+
     def unlogColumns(self):
         """ Unlog columns containing logged quantities 
         
+            Powers are computed in double precision and stored in the data
+            type of the isochrone array, as col() does.
         """
         logged = defs.getLoggedQuantities(self.brand) 
         for prop in logged:
             i = self.column[prop]
-            self.isochrone[:, i] = 10.0**self.isochrone[:, i]
+            self.isochrone[:, i] = 10.0**np.asarray(self.isochrone[:, i], dtype = np.float64)
+        self.unlogged = True
+        self.derived  = {}
         #print '\nQuantities successfully unlogged.\n'
     
     
@@ -228,10 +325,10 @@ class Isochrone(object):
     
     def loadIsochroneHeader(self):
         """ Read isochrone file header """
-        import fileinput as fi
         self.header_loaded = True
         if self.comm_rows == 0:
-            self.header = [line for line in fi.input(self.filepath) if line[0] == '#']
+            self.header = [line for line in readers.readLines(self.filepath) 
+                           if line[0] == '#']
         else:
             self.header = []
     
@@ -247,42 +344,93 @@ class Isochrone(object):
         """ Parse data in isochrone header """
     
     
-    def addColor(self, system = ''):
-        """ Perform color-Teff transformation using requested system """
-        import teffcolor as tc
-        self.magnitudes = tc.transform(self.Fe_H, self.A_Fe, 
-                                       self.isochrone[:, 2],
-                                       self.isochrone[:, 4], 
-                                       self.isochrone[:, 3],
-                                       len(self.isochrone))
-        self.isochrone = np.concatenate((self.isochrone, self.magnitudes), axis=1)
-        self.addMagsToHeader()
+    def addColor(self, system = 'UBVRIJHK'):
+        """ Perform color-Teff transformation using requested system 
+        
+            Magnitudes are computed from bolometric corrections interpolated
+            in (Teff, log(g), [Fe/H], [a/Fe]) and appended as new columns. 
+            To transform many isochrones at once, pass a list of isochrones
+            to bolcorr.transform() directly.
+            
+            Optional Arguments:
+            -------------------
+            system  ::  photometric system listed in defs.bc_tables.
+            
+        """
+        from .bolcorr import transform
+        transform(self, system = system)
     
     
-    def addMagsToHeader(self):
+    def addMagsToHeader(self, filters = None):
         """ Add magnitude designation to header information """
-        s = '{:^10s}{:^10s}{:^10s}{:^10s}{:^10s}{:^10s}{:^10s}{:^10s}{:^10s}\n'.format('B', 
-                                                                             'V', 'R', 'I', 
-                                                                             'V', 'I', 'J', 
-                                                                             'H', 'K')
-        self.header[-1] = self.header[-1].rstrip()
+        if filters is None:
+            filters = defs.getMagLayout(self.brand) or ['B', 'V', 'R', 'I', 'V', 'I', 
+                                                        'J', 'H', 'K']
+        try:
+            self.header[-1] = self.header[-1].rstrip()
+        except (AttributeError, IndexError):
+            return
+        s = ''.join(['{:^10s}'.format(f) for f in filters]) + '\n'
         self.header[-1] += s
     
     
-    def writeIsochrone(self):
-        """ Write out isochrone data with magnitudes to a file """
-        import os
-        # check if directory exists
-        try:
-            os.stat(self.directory)
-        except OSError:
-            os.mkdir(self.directory)
-        fout = open(self.filepath, 'w')
-        for line in self.header:
-            fout.write(line)
-        np.savetxt(fout, self.isochrone, fmt='%10.6f')
-        fout.close()
+    def writeIsochrone(self, binary = False):
+        """ Write out isochrone data with magnitudes to a file 
+        
+            Optional Arguments:
+            -------------------
+            binary  ::  also write the binary sibling (.npz) that is read
+                        in place of the text file by loadIsochrone().
+            
+        """
+        writeIsochrones([self], binary = binary)
     
     
     def plotIsochrone():
         """ Plot different properties of an isochrone """
+
+
+def writeIsochrones(isochrones, binary = False):
+    """ Write a set of isochrones to their files 
+    
+        All isochrones are first written to temporary files in their
+        destination directories. Once every file is complete, each is 
+        renamed over its final name, so concurrent readers never see a 
+        partially written isochrone. Text is formatted in whole blocks
+        with readers.formatTable().
+    
+        Required Arguments:
+        -------------------
+        isochrones  ::  list of isochrone objects.
+        
+        Optional Arguments:
+        -------------------
+        binary      ::  also write binary siblings (.npz) of each file.
+    
+    """
+    import os
+    renames = []
+    for iso in isochrones:
+        # check if directory exists
+        if not os.path.isdir(iso.directory):
+            os.makedirs(iso.directory)
+        
+        tmp  = '{0}/.{1}.tmp'.format(iso.directory, iso.filename)
+        fout = open(tmp, 'w')
+        fout.write(''.join(iso.header))
+        fout.write(readers.formatTable(iso.isochrone, fmt = '%10.6f'))
+        fout.close()
+        renames.append((tmp, iso.filepath))
+        
+        if binary:
+            tmp = '{0}/.{1}.npz.tmp'.format(iso.directory, iso.filename)
+            readers.writeBinary(tmp, iso.isochrone, iso.header)
+            renames.append((tmp, readers.binaryPath(iso.filepath)))
+    
+    for tmp, filepath in renames:
+        os.rename(tmp, filepath)
+    
+    for iso in isochrones:
+        iso.exists = True
+        if iso.brand in manifest._manifests:
+            manifest._manifests[iso.brand].addFile(iso.filepath)
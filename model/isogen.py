@@ -160,3 +160,94 @@ def interpolateMassTracks(feh_new = None, afe_new = None, skip_feh = False,
     else:
         pass
     
+
+
+# maximum differences accepted between generated and stored isochrones
+# (solar masses for the terminal mass, dex for all other quantities)
+tolerances = {'mass': 0.02, 'logg': 0.02, 'teff': 0.005, 'luminosity': 0.02,
+              'radius': 0.01}
+
+def validateGeneration(nodes = None, N_nodes = 10, tolerances = tolerances, seed = None):
+    """ Compare generated isochrones with the stored Dartmouth isochrones
+    
+        Isochrones are generated from the mass track library for a sample
+        of grid nodes and compared with the precomputed isochrone files.
+        The terminal (maximum) masses are compared directly; log(g) and 
+        the logs of Teff, L and R are compared at the generated masses by 
+        interpolating the stored isochrone in mass. The time taken to 
+        generate each isochrone is recorded, so that faster generation
+        schemes can be checked for accuracy at the same time.
+        
+        Optional Arguments:
+        -------------------
+        nodes       ::  list of (afe, feh, age) nodes to test. Defaults to
+                        a random sample of stored isochrones whose 
+                        composition is covered by the mass track library.
+        
+        N_nodes     ::  number of nodes sampled.
+        
+        tolerances  ::  dictionary of maximum absolute differences for 
+                        'mass', 'logg', 'teff', 'luminosity', 'radius'.
+        
+        seed        ::  seed of the random number generator.
+        
+        Returns:
+        --------
+        results     ::  list with one row per node: [age (Myr), [Fe/H], 
+                        [a/Fe], generation time (s), points compared, 
+                        max differences in mass, logg, teff, luminosity,
+                        radius, within tolerances].
+        
+    """
+    import time
+    import numpy as np
+    from .isochrone import Isochrone
+    from .manifest import getManifest
+    
+    props = ['logg', 'teff', 'luminosity', 'radius']
+    logged = defs.getLoggedQuantities('Dartmouth')
+    
+    if nodes is None:
+        manifest = getManifest('Dartmouth')
+        tracks = set((feh, afe) for mass, feh, afe in manifest.trackNodes())
+        nodes  = [node for node in manifest.isochroneNodes() if (node[1], node[0]) in tracks]
+        if len(nodes) > N_nodes:
+            sample = np.random.RandomState(seed).choice(len(nodes), N_nodes, replace = False)
+            nodes  = [nodes[k] for k in sorted(sample)]
+    
+    print '{:>8s}{:>7s}{:>7s}{:>9s}{:>6s}{:>9s}{:>9s}{:>9s}{:>9s}{:>9s}'.format('age', 
+          '[Fe/H]', '[a/Fe]', 'time', 'N', 'mass', 'logg', 'teff', 'lumin', 'radius')
+    results = []
+    for afe, feh, age in nodes:
+        stored = Isochrone(age, feh, alpha_enhancement = afe)
+        stored.loadIsochrone()
+        if not stored.is_loaded:
+            continue
+        
+        generated = Isochrone(age, feh, alpha_enhancement = afe)
+        start = time.time()
+        generated.generateIsochrone()
+        elapsed = time.time() - start
+        
+        # stored isochrones are unlogged when loaded, generated are not
+        s_data  = stored.isochrone
+        g_data  = generated.isochrone
+        s_mass  = s_data[:, stored.column['mass']]
+        g_mass  = g_data[:, generated.column['mass']]
+        order   = np.argsort(s_mass)
+        overlap = (g_mass >= s_mass[order[0]]) & (g_mass <= s_mass[order[-1]])
+        
+        diffs = [abs(np.max(g_mass) - np.max(s_mass)) if len(g_mass) > 0 else np.nan]
+        for prop in props:
+            s_prop = s_data[order, stored.column[prop]]
+            if prop in logged:
+                s_prop = np.log10(s_prop)
+            model = np.interp(g_mass[overlap], s_mass[order], s_prop)
+            diff  = np.abs(g_data[overlap, generated.column[prop]] - model)
+            diffs.append(np.max(diff) if len(diff) > 0 else np.nan)
+        
+        passed = all(d <= tolerances[p] for d, p in zip(diffs, ['mass'] + props))
+        results.append([age/1.e6, feh, afe, elapsed, int(np.sum(overlap))] + diffs + [passed])
+        print '{:8.1f}{:7.2f}{:7.2f}{:9.4f}{:6d}{:9.4f}{:9.4f}{:9.4f}{:9.4f}{:9.4f}{:>6s}'.format(
+              *(results[-1][:-1] + ['ok' if passed else 'FAIL']))
+    return results
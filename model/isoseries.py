@@ -1,17 +1,65 @@
 #
 from . import isochrone as diso
-from . import masstrack as dlib
+from . import bolcorr
+from . import defs
 from numpy import arange
 
-ages = arange(1.75e9, 13.6e9, 1.e9)
-afe  = 0.
+__all__ = ['generateSeries']
 
-for age in ages:
-    for feh in dlib.feh_list:
-        print 'Age = {:6.0f}  [Fe/H] = {:+4.1f}\n'.format(age/1.e6, feh)
-        iso = diso.Isochrone(age, feh)
-        iso.generateIsochrone()
-        iso.addColor()
-        iso.writeIsochrone()
 
-        
+def generateSeries(ages, afe = 0., brand = 'Dartmouth', callback = None):
+    """ Generate, transform and write isochrones over a range of ages
+
+        Isochrones are generated from the mass track library for every age
+        and every [Fe/H] of the brand, transformed to magnitudes in one
+        call and written to their binary files.
+
+        Required Arguments:
+        -------------------
+        ages      ::  list of ages (yr).
+
+        Optional Arguments:
+        -------------------
+        afe       ::  alpha-element enhancement.
+
+        brand     ::  model set whose [Fe/H] range is used.
+
+        callback  ::  function receiving a progress event after each
+                      isochrone, with its 'age' (Myr) and 'feh' (see
+                      utils.progress.Progress).
+
+        Returns:
+        --------
+        isochrones  ::  list of the generated isochrone objects.
+
+    """
+    from ..utils.progress import Progress
+
+    fe_h     = defs.getFeHRange(brand)
+    progress = Progress(callback, 'generateSeries', total = len(ages)*len(fe_h))
+    progress.start()
+
+    isochrones = []
+    for age in ages:
+        for feh in fe_h:
+            iso = diso.Isochrone(age, feh, alpha_enhancement = afe, brand = brand)
+            iso.generateIsochrone()
+            isochrones.append(iso)
+            progress.update(age = age/1.e6, feh = feh)
+
+    # transform the full series to magnitudes in one call
+    bolcorr.transform(isochrones)
+
+    diso.writeIsochrones(isochrones, binary = True)
+    progress.finish()
+    return isochrones
+
+
+def printIsochrone(event):
+    """ Callback printing the age and [Fe/H] of each generated isochrone """
+    if event['event'] == 'progress':
+        print 'Age = {:6.0f}  [Fe/H] = {:+4.1f}\n'.format(event['age'], event['feh'])
+
+
+if __name__ == '__main__':
+    generateSeries(arange(1.75e9, 13.6e9, 1.e9), afe = 0., callback = printIsochrone)
@@ -0,0 +1,257 @@
+#
+#
+import numpy as np
+from . import defs
+
+__all__ = ['IsochroneSet', 'loadIsochroneSet']
+
+GMsun = 1.32712440041e26
+Rsun  = 6.956e10
+Lsun  = 3.839e33
+sig   = 5.6704e-5
+
+
+class IsochroneSet(object):
+
+    def __init__(self, isochrones, dtype = None):
+        """ Many isochrones held in one contiguous array
+
+            The rows of all isochrones are concatenated into a single
+            array sharing one column map. The rows of isochrone k are
+            data[offsets[k]:offsets[k + 1]], and the age, [Fe/H], [a/Fe]
+            and brand of each isochrone are kept in parallel arrays.
+            Isochrones read from files and isochrones generated with isogen
+            (which are still logged) may be mixed; only the columns common
+            to all isochrones are kept.
+
+            Required Arguments:
+            -------------------
+            isochrones  ::  list of isochrone objects. Isochrones that are
+                            not loaded yet are loaded, and those that fail
+                            to load are left out.
+
+            Optional Arguments:
+            -------------------
+            dtype       ::  data type of the array. Defaults to the storage
+                            type set in defs.
+
+            Returns:
+            --------
+            IsochroneSet object.
+
+        """
+        if dtype is None:
+            dtype = defs.getStorageDtype()
+
+        loaded = []
+        for iso in isochrones:
+            # generated isochrones hold data without being marked as loaded
+            if getattr(iso, 'isochrone', None) is None:
+                iso.loadIsochrone()
+            if iso.is_loaded or getattr(iso, 'isochrone', None) is not None:
+                loaded.append(iso)
+
+        # generated isochrones name magnitude columns before they are filled
+        present = [set(name for name, i in iso.column.items() if i < iso.isochrone.shape[1])
+                   for iso in loaded]
+        names = set.intersection(*present) if len(loaded) > 0 else set()
+        names = sorted(names, key = lambda name: loaded[0].column[name])
+        self.column = dict((name, k) for k, name in enumerate(names))
+
+        lengths = [len(iso.isochrone) for iso in loaded]
+        self.offsets = np.concatenate(([0], np.cumsum(lengths))).astype(int)
+        self.data = np.empty((self.offsets[-1], len(names)), dtype = dtype)
+        for k, iso in enumerate(loaded):
+            cols = [iso.column[name] for name in names]
+            self.data[self.offsets[k]:self.offsets[k + 1]] = iso.isochrone[:, cols]
+
+        self.ages     = np.array([iso.age for iso in loaded], dtype = float)
+        self.feh      = np.array([iso.Fe_H for iso in loaded], dtype = float)
+        self.afe      = np.array([iso.A_Fe for iso in loaded], dtype = float)
+        self.brand    = np.array([iso.brand for iso in loaded])
+        self.unlogged = np.array([iso.unlogged for iso in loaded], dtype = bool)
+
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+
+    def __getitem__(self, k):
+        """ View of the rows of isochrone k """
+        return self.data[self.offsets[k]:self.offsets[k + 1]]
+
+
+    def owner(self):
+        """ Index of the isochrone of every row """
+        return np.repeat(np.arange(len(self)), np.diff(self.offsets))
+
+
+    def col(self, name):
+        """ Column of every row of the set """
+        return self.data[:, self.column[name]]
+
+
+    def select(self, age = None, feh = None, afe = None, brand = None):
+        """ Isochrones matching the given age, [Fe/H], [a/Fe] and brand
+
+            Each argument is a value or a list of values; None matches all.
+            A contiguous run of isochrones is returned as a view of the
+            array, sharing its unlogged flags with this set so that rows
+            are never unlogged twice; otherwise the selected rows are
+            copied.
+
+            Returns:
+            --------
+            IsochroneSet object.
+
+        """
+        keep = np.ones(len(self), dtype = bool)
+        for value, nodes in [(age, self.ages), (feh, self.feh), (afe, self.afe),
+                             (brand, self.brand)]:
+            if value is not None:
+                keep &= np.in1d(nodes, np.atleast_1d(value))
+        return self.subset(np.nonzero(keep)[0])
+
+
+    def subset(self, index):
+        """ Isochrones at the given positions of the set (see select) """
+        index = np.asarray(index, dtype = int)
+        new = IsochroneSet.__new__(IsochroneSet)
+        new.column = dict(self.column)
+        lengths = self.offsets[index + 1] - self.offsets[index]
+        new.offsets = np.concatenate(([0], np.cumsum(lengths))).astype(int)
+        for name in ['ages', 'feh', 'afe', 'brand']:
+            setattr(new, name, getattr(self, name)[index])
+        if len(index) > 0 and np.all(np.diff(index) == 1):
+            new.data = self.data[self.offsets[index[0]]:self.offsets[index[-1] + 1]]
+            # views of the flags, so unlogging either set marks the shared rows
+            new.unlogged = self.unlogged[index[0]:index[-1] + 1]
+        else:
+            rows = np.repeat(self.offsets[index] - new.offsets[:-1], lengths) + \
+                   np.arange(new.offsets[-1])
+            new.data = self.data[rows]
+            new.unlogged = self.unlogged[index]
+        return new
+
+
+    def unlogColumns(self):
+        """ Unlog logged quantities of every isochrone not yet unlogged """
+        for brand in np.unique(self.brand[~self.unlogged]):
+            todo = (self.brand == brand) & ~self.unlogged
+            rows = todo[self.owner()]
+            for prop in defs.getLoggedQuantities(brand):
+                if prop in self.column:
+                    i = self.column[prop]
+                    self.data[rows, i] = 10.0**np.asarray(self.data[rows, i], dtype = np.float64)
+            self.unlogged[todo] = True
+
+
+    def deriveRadius(self):
+        """ Add a radius column, from log(g) or the Stefan-Boltzmann law
+
+            The radius is computed in double precision for all rows at once.
+            Nothing is done if the isochrones already have a radius.
+
+        """
+        if 'radius' in self.column:
+            return
+        self.unlogColumns()
+        mass = np.asarray(self.col('mass'), dtype = np.float64)
+        if 'logg' in self.column:
+            logg   = np.asarray(self.col('logg'), dtype = np.float64)
+            radius = np.sqrt(GMsun*mass/10.0**logg)/Rsun
+        else:
+            lumin  = np.asarray(self.col('luminosity'), dtype = np.float64)
+            teff   = np.asarray(self.col('teff'), dtype = np.float64)
+            radius = np.sqrt(lumin*Lsun/(4.0*np.pi*sig*teff**4))/Rsun
+        self.data = np.column_stack((self.data, radius.astype(self.data.dtype)))
+        self.column['radius'] = self.data.shape[1] - 1
+
+
+    def interpolate(self, prop, x, independent = 'mass'):
+        """ Property of every isochrone at the given independent values
+
+            All isochrones are interpolated at once: rows are sorted by
+            isochrone and then by the independent variable, and every
+            query is located among all rows with a single search.
+
+            Required Arguments:
+            -------------------
+            prop         ::  isochrone column to interpolate.
+
+            x            ::  array of values of the independent variable.
+
+            Optional Arguments:
+            -------------------
+            independent  ::  isochrone column used as the independent
+                             variable.
+
+            Returns:
+            --------
+            values       ::  array of shape (isochrones, len(x)), NaN where
+                             x is outside of an isochrone.
+
+        """
+        x     = np.asarray(x, dtype = np.float64)
+        owner = self.owner()
+        xr    = np.asarray(self.col(independent), dtype = np.float64)
+        yr    = np.asarray(self.col(prop), dtype = np.float64)
+        order = np.lexsort((xr, owner))
+        xr, yr, owner = xr[order], yr[order], owner[order]
+
+        # shift each isochrone so that all rows are in one increasing sequence
+        span  = max(np.nanmax(xr) - np.nanmin(xr), np.max(x) - np.min(x), 1.) + 1.
+        base  = min(np.nanmin(xr), np.min(x))
+        key   = (xr - base) + span*owner
+        query = (x - base)[np.newaxis, :] + span*np.arange(len(self))[:, np.newaxis]
+
+        j  = np.clip(np.searchsorted(key, query), 1, len(key) - 1)
+        x0, x1 = key[j - 1], key[j]
+        with np.errstate(invalid = 'ignore', divide = 'ignore'):
+            w = np.where(x1 > x0, (query - x0)/(x1 - x0), 0.)
+        values = yr[j - 1] + w*(yr[j] - yr[j - 1])
+
+        k = np.arange(len(self))[:, np.newaxis]
+        inside = (owner[j - 1] == k) & (owner[j] == k) & (query >= x0) & (query <= x1)
+        exact  = (owner[j] == k) & (query == x1)
+        values = np.where(exact, yr[j], values)
+        values[~(inside | exact)] = np.nan
+        return values
+
+
+    def isochrone(self, k):
+        """ Isochrone object of isochrone k, with a copy of its rows
+
+            The rows are copied since Isochrone.unlogColumns unlogs them in
+            place without regard to the set's unlogged flags.
+        """
+        from .isochrone import Isochrone
+        iso = Isochrone(self.ages[k], self.feh[k], alpha_enhancement = self.afe[k],
+                        brand = self.brand[k])
+        iso.isochrone = self[k].copy()
+        iso.column    = dict(self.column)
+        iso.header    = []
+        iso.is_loaded = True
+        iso.unlogged  = self.unlogged[k]
+        return iso
+
+
+def loadIsochroneSet(brand, nodes = None, dtype = None):
+    """ Load isochrones of a model set into an IsochroneSet
+
+        Optional Arguments:
+        -------------------
+        nodes  ::  list of (afe, feh, age) grid nodes. Defaults to every
+                   isochrone of the brand.
+
+        dtype  ::  data type of the array.
+
+    """
+    from .isochrone import Isochrone
+    from .manifest import getManifest
+
+    if nodes is None:
+        nodes = getManifest(brand).isochroneNodes()
+    isochrones = [Isochrone(age, feh, alpha_enhancement = afe, brand = brand)
+                  for afe, feh, age in nodes]
+    return IsochroneSet([iso for iso in isochrones if iso.exists], dtype = dtype)
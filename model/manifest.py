@@ -0,0 +1,205 @@
+#
+#
+import os
+import json
+from . import defs
+from ..utils.compress import suffixes, resolvePath
+
+__all__ = ['Manifest', 'getManifest', 'fileExists']
+
+# manifests in use, keyed by model brand
+_manifests = {}
+
+class Manifest(object):
+
+    def __init__(self, brand, refresh = False):
+        """ Index of the model files that exist for a model brand
+
+            The brand's model directory is scanned once and the list of
+            files is cached on disk (.dsetools_manifest in the model
+            directory, or under ~/.dsetools_cache if the model directory
+            is not writable), so later lookups of whether an isochrone or mass
+            track exists are set lookups rather than filesystem calls. The
+            modification time of every directory is stored with the cache;
+            if a file has since been added to or removed from a directory,
+            the cache is rebuilt automatically.
+
+            Required Arguments:
+            -------------------
+            brand    ::  modeling group.
+
+            Optional Arguments:
+            -------------------
+            refresh  ::  rescan the model directory even if a valid cache
+                         exists.
+
+            Returns:
+            --------
+            Manifest object.
+
+        """
+        self.brand     = brand
+        self.iso_nodes = None
+        self.trk_nodes = None
+        self.dirs      = {}
+        self.files     = set()
+
+        directory = defs.getModelDirectory(brand)
+        if directory is None:
+            print 'ERROR: Model directory for {0} is not set (${1}).\n'.format(brand,
+                                                                  defs.shell_env[brand])
+            self.root = None
+            return
+        self.root      = os.path.normpath(directory)
+        self.cachepath = os.path.join(self.root, '.dsetools_manifest')
+        self.fallback  = fallbackPath(self.root)
+
+        if refresh or not self.loadCache():
+            self.scan()
+            self.writeCache()
+
+
+    def scan(self):
+        """ Walk the model directory and record every file """
+        # create the cache file first so writing it does not alter the
+        # recorded modification time of the model directory
+        try:
+            open(self.cachepath, 'a').close()
+        except IOError:
+            pass
+
+        self.dirs  = {}
+        self.files = set()
+        for path, dirnames, filenames in os.walk(self.root):
+            rel = os.path.relpath(path, self.root)
+            self.dirs[rel] = os.path.getmtime(path)
+            for name in filenames:
+                self.files.add(os.path.normpath(os.path.join(rel, name)))
+        self.files.discard(os.path.basename(self.cachepath))
+
+
+    def loadCache(self):
+        """ Load cached manifest, returns False if missing or out of date """
+        cache = None
+        for cachepath in [self.cachepath, self.fallback]:
+            try:
+                fin   = open(cachepath)
+                cache = json.load(fin)
+                fin.close()
+                break
+            except (IOError, ValueError):
+                continue
+        if cache is None:
+            return False
+
+        for rel, mtime in cache['dirs'].items():
+            try:
+                if os.path.getmtime(os.path.join(self.root, rel)) != mtime:
+                    return False
+            except OSError:
+                return False
+        self.dirs  = cache['dirs']
+        self.files = set(cache['files'])
+        return True
+
+
+    def writeCache(self):
+        """ Write manifest to the model directory, or to the fallback location """
+        for cachepath in [self.cachepath, self.fallback]:
+            try:
+                if not os.path.isdir(os.path.dirname(cachepath)):
+                    os.makedirs(os.path.dirname(cachepath))
+                fout = open(cachepath, 'w')
+                json.dump({'dirs': self.dirs, 'files': sorted(self.files)}, fout)
+                fout.close()
+                return
+            except (IOError, OSError):
+                continue
+        print 'WARNING: Unable to write manifest {0}.\n'.format(self.cachepath)
+
+
+    def relativePath(self, filepath):
+        """ Path of a model file relative to the brand's model directory """
+        return os.path.normpath(os.path.relpath(filepath, self.root))
+
+
+    def hasFile(self, filepath):
+        """ Check whether a model file, or a compressed variant, is in the manifest """
+        if self.root is None:
+            return False
+        rel = self.relativePath(filepath)
+        if rel in self.files:
+            return True
+        for suffix in suffixes:
+            if rel + suffix in self.files:
+                return True
+        return False
+
+
+    def addFile(self, filepath):
+        """ Record a newly written model file """
+        if self.root is None:
+            return
+        self.files.add(self.relativePath(filepath))
+        self.iso_nodes = None
+        self.trk_nodes = None
+
+
+    def isochroneNodes(self):
+        """ Get (afe, feh, age) nodes of the grid with an isochrone file
+
+            Nodes are returned in the scan order of defs.getIsochroneGrid().
+        """
+        from .isochrone import Isochrone
+        if self.iso_nodes is None:
+            self.iso_nodes = [(afe, feh, age) for afe, feh, age in
+                              defs.getIsochroneGrid(self.brand) if self.hasFile(
+                              Isochrone(age, feh, alpha_enhancement = afe,
+                                        brand = self.brand).filepath)]
+        return self.iso_nodes
+
+
+    def trackNodes(self):
+        """ Get (mass, feh, afe) nodes of the mass track library with a file """
+        from .masstrack import MassTrack
+        if self.trk_nodes is None:
+            self.trk_nodes = [(mass, feh, afe) for afe in defs.getAFeRange(self.brand)
+                                               for feh in defs.getFeHRange(self.brand)
+                                               for mass in defs.getMassRange(self.brand)
+                              if self.hasFile(MassTrack(mass, feh, afe).filepath)]
+        return self.trk_nodes
+
+
+    def getAges(self, feh, afe = 0.0):
+        """ Get ages with an isochrone file at a given composition """
+        return [age for a, f, age in self.isochroneNodes() if f == feh and a == afe]
+
+
+def fallbackPath(root):
+    """ Manifest location for a model directory that is not writable """
+    import hashlib
+    name = 'manifest_{0}.json'.format(hashlib.md5(root).hexdigest())
+    return os.path.join(os.path.expanduser('~'), '.dsetools_cache', name)
+
+
+def getManifest(brand, refresh = False):
+    """ Get manifest for a model brand, building it on first request
+
+        Once a manifest has been requested, isochrone objects of that brand
+        use it to determine whether their file exists. A brand without a
+        model directory gets an empty manifest, which is not kept, so the
+        directory can still be set later.
+    """
+    if refresh or brand not in _manifests:
+        manifest = Manifest(brand, refresh = refresh)
+        if manifest.root is None:
+            return manifest
+        _manifests[brand] = manifest
+    return _manifests[brand]
+
+
+def fileExists(brand, filepath):
+    """ Check model file or a compressed variant exists, using the manifest if in use """
+    if brand in _manifests:
+        return _manifests[brand].hasFile(filepath)
+    return resolvePath(filepath) is not None
@@ -31,7 +31,8 @@ class MassTrack(object):
         """ Load stellar evolution mass track into an array.
             
             The file associated with the mass track object is loaded if
-            the file exists. Otherwise, the program will throw an error.
+            the file, or a compressed .gz/.bz2/.xz variant, exists. 
+            Otherwise, the program will throw an error.
             By default, the routine will peel the columns from a larger
             track file to generate individual properties. This option 
             can be turned off, in which case the routine will save the 
@@ -44,8 +45,9 @@ class MassTrack(object):
                             properties (OPTIONAL).
                       
         """
+        from .readers import readTable
         try:
-            self.track = np.genfromtxt(self.filepath, comments='#')
+            self.track = readTable(self.filepath, comments='#')
             flag = 0
         except:
             print '\nERROR: File {0} not found.\n'.format(self.filepath)
@@ -76,17 +78,16 @@ class MassTrack(object):
         
     def inRange(self):
         # check that [Fe/H] and [a/Fe] are in range of track library
-        if not min(defs.feh_list) <= self.feh <= max(defs.feh_list):
+        feh_list = defs.getFeHRange('Dartmouth')
+        afe_list = defs.getAFeRange('Dartmouth')
+        in_range = True
+        if not min(feh_list) <= self.feh <= max(feh_list):
             print '\nRequested [Fe/H] = {:+6.2f} is out of range.\n'.format(self.feh)
             in_range = False
-        else:
-            in_range = True
             
-        if not min(defs.afe_list) <= self.afe <= max(defs.afe_list):
+        if not min(afe_list) <= self.afe <= max(afe_list):
             print '\nRequested [a/Fe] = {:+6.2f} is out of range.\n'.format(self.afe)
             in_range = False
-        else:
-            in_range = True         
         return in_range
         
     def inLibrary(self):
@@ -95,25 +96,12 @@ class MassTrack(object):
             Confirms whether or not a mass track with the specified 
             properties already exists in the pre-computed library. The
             routine also checks user generated tracks that have been 
-            computed in the past.
+            computed in the past. Existence is looked up in the manifest
+            of the Dartmouth model directory.
         """
-        if self.mass not in defs.mass_list:
-            self.mass_exists = False
-        else:
-            self.mass_exists = True
-        
-        if self.feh not in defs.feh_list:
-            self.feh_exists = False
-        else:
-            self.feh_exists = True
-        
-        if self.afe not in defs.afe_list:
-            self.afe_exists = False
-        else:
-            self.afe_exists = True
-        
-        if self.mass_exists and self.feh_exists and self.afe_exists:
-            self.in_library = True
-        else:
-            self.in_library = False
+        from . import manifest
+        self.mass_exists = self.mass in defs.getMassRange('Dartmouth')
+        self.feh_exists  = self.feh in defs.getFeHRange('Dartmouth')
+        self.afe_exists  = self.afe in defs.getAFeRange('Dartmouth')
         
+        self.in_library  = manifest.getManifest('Dartmouth').hasFile(self.filepath)
@@ -0,0 +1,234 @@
+#
+#
+import numpy as np
+from . import defs
+
+__all__ = ['imfs', 'samplePopulation', 'iterPopulation', 'populationFields']
+
+# initial mass functions as piecewise power laws, dN/dM ~ M**(-alpha),
+# given as (lower mass bound, upper mass bound, alpha)
+imfs = {'salpeter': [(0.0, np.inf, 2.35)],
+        'kroupa'  : [(0.0, 0.08, 0.3), (0.08, 0.5, 1.3), (0.5, np.inf, 2.3)],
+        'uniform' : [(0.0, np.inf, 0.0)]
+       }
+
+
+def imfDensity(imf, masses):
+    """ Evaluate (unnormalized) initial mass function dN/dM at given masses
+
+        Power law segments are joined so that the IMF is continuous.
+        A callable may also be provided, in which case it is evaluated
+        directly.
+    """
+    if callable(imf):
+        return imf(masses)
+
+    density = np.zeros(len(masses))
+    scale   = 1.0
+    for k, (m_lo, m_hi, alpha) in enumerate(imfs[imf]):
+        # normalize each segment to match the previous one at the break
+        if k > 0:
+            scale = scale*m_lo**(alpha - imfs[imf][k - 1][2])
+        in_seg = (masses >= m_lo) & (masses < m_hi)
+        density[in_seg] = scale*masses[in_seg]**(-alpha)
+    return density
+
+
+def massCDF(imf, m_min, m_max, N_grid = 4096):
+    """ Tabulate cumulative distribution of the IMF on a logarithmic grid """
+    grid = np.logspace(np.log10(m_min), np.log10(m_max), N_grid)
+    pdf  = imfDensity(imf, grid)
+    cdf  = np.concatenate(([0.], np.cumsum(0.5*(pdf[1:] + pdf[:-1])*np.diff(grid))))
+    return grid, cdf/cdf[-1]
+
+
+def drawMassRatios(random, N, q_dist, q_min):
+    """ Draw secondary-to-primary mass ratios
+
+        The distribution is either 'uniform' on [q_min, 1] or a power law
+        dN/dq ~ q**gamma on [q_min, 1], given as the float gamma.
+    """
+    u = random.random_sample(N)
+    if q_dist == 'uniform':
+        return q_min + u*(1.0 - q_min)
+    else:
+        g = q_dist + 1.0
+        return (q_min**g + u*(1.0 - q_min**g))**(1.0/g)
+
+
+def populationFields(isochrone, phot_errors = {}):
+    """ Fields of the rows drawn by samplePopulation and iterPopulation
+
+        The isochrone is loaded if it is not already. The returned list can
+        be passed as the dtype of an output array, e.g. a memory map the
+        chunks of iterPopulation are written to.
+    """
+    if not isochrone.is_loaded:
+        isochrone.loadIsochrone()
+    names  = sorted(isochrone.column, key = lambda x: isochrone.column[x])
+    mags   = [x for x in names if x[0] == 'M']
+    fields = [(x, 'f8') for x in names] + [('mass2', 'f8'), ('binary', '?')]
+    fields += [('e_' + x, 'f8') for x in mags if x in phot_errors]
+    return fields
+
+
+def iterPopulation(isochrone, N, imf = 'kroupa', binary_fraction = 0.0,
+                   q_dist = 'uniform', q_min = 0.1, phot_errors = {},
+                   chunk_size = 100000, seed = None):
+    """ Draw a synthetic stellar population from an isochrone, chunk by chunk
+
+        Primary masses are drawn from the initial mass function by
+        inverse-CDF sampling over the mass range covered by the isochrone.
+        Every isochrone column (including magnitude columns such as 'Mv'
+        or 'Mk') is then interpolated to the sampled masses in a single
+        vectorized pass. A fraction of stars are given unresolved companions
+        whose light is added to the magnitude and luminosity columns.
+        Companions less massive than the lowest isochrone mass are treated
+        as dark. Only one chunk of systems is held in memory at a time, so
+        populations of any size can be processed or written out as they
+        are drawn.
+
+        Required Arguments:
+        -------------------
+        isochrone        ::  isochrone object (loaded if not already).
+
+        N                ::  number of systems to draw.
+
+        Optional Arguments:
+        -------------------
+        imf              ::  name of IMF in population.imfs or a callable
+                             returning dN/dM for an array of masses.
+
+        binary_fraction  ::  fraction of systems that are binaries.
+
+        q_dist           ::  mass ratio distribution, 'uniform' or the
+                             power law index gamma of dN/dq ~ q**gamma.
+
+        q_min            ::  minimum mass ratio.
+
+        phot_errors      ::  dictionary of photometric uncertainties keyed
+                             by magnitude column (e.g., {'Mv': 0.02}).
+                             Values may be floats or callables that return
+                             the uncertainty as a function of magnitude.
+
+        chunk_size       ::  number of systems generated at once.
+
+        seed             ::  seed for the random number generator.
+
+        Yields:
+        -------
+        chunk            ::  structured array of up to chunk_size systems,
+                             with the fields of populationFields: 'mass2'
+                             and 'binary' in addition to each isochrone
+                             column. Magnitudes with errors applied have an
+                             accompanying 'e_' field.
+
+    """
+    fields = populationFields(isochrone, phot_errors)
+    random = np.random.RandomState(seed)
+
+    # sort isochrone by mass for interpolation
+    data   = isochrone.isochrone
+    data   = data[np.argsort(data[:, isochrone.column['mass']])]
+    iso_m  = data[:, isochrone.column['mass']]
+    grid, cdf = massCDF(imf, iso_m[0], iso_m[-1])
+
+    # quantities that combine for unresolved companions
+    names  = sorted(isochrone.column, key = lambda x: isochrone.column[x])
+    mags   = [x for x in names if x[0] == 'M']
+    logged = [] if isochrone.unlogged else defs.getLoggedQuantities(isochrone.brand)
+
+    for start in range(0, N, chunk_size):
+        n     = min(chunk_size, N - start)
+        chunk = np.empty(n, dtype = fields)
+
+        m1 = np.interp(random.random_sample(n), cdf, grid)
+        for x in names:
+            chunk[x] = np.interp(m1, iso_m, data[:, isochrone.column[x]])
+
+        # unresolved companions
+        binary = random.random_sample(n) < binary_fraction
+        m2     = np.where(binary, m1*drawMassRatios(random, n, q_dist, q_min), 0.0)
+        lit    = binary & (m2 >= iso_m[0])
+        chunk['mass2']  = m2
+        chunk['binary'] = binary
+
+        for x in mags:
+            m_comp = np.interp(m2[lit], iso_m, data[:, isochrone.column[x]])
+            chunk[x][lit] = -2.5*np.log10(10.0**(-0.4*chunk[x][lit]) +
+                                          10.0**(-0.4*m_comp))
+        if 'luminosity' in isochrone.column:
+            L_comp = np.interp(m2[lit], iso_m, data[:, isochrone.column['luminosity']])
+            if 'luminosity' in logged:
+                chunk['luminosity'][lit] = np.log10(10.0**chunk['luminosity'][lit] +
+                                                    10.0**L_comp)
+            else:
+                chunk['luminosity'][lit] += L_comp
+
+        # photometric errors
+        for x in mags:
+            if x not in phot_errors:
+                continue
+            if callable(phot_errors[x]):
+                sigma = phot_errors[x](chunk[x])
+            else:
+                sigma = np.repeat(phot_errors[x], n)
+            chunk['e_' + x] = sigma
+            chunk[x] += sigma*random.standard_normal(n)
+
+        yield chunk
+
+
+def samplePopulation(isochrone, N, imf = 'kroupa', binary_fraction = 0.0,
+                     q_dist = 'uniform', q_min = 0.1, phot_errors = {},
+                     chunk_size = 100000, seed = None):
+    """ Draw a synthetic stellar population from an isochrone
+
+        Systems are drawn as in iterPopulation and collected in a single
+        array. Only the temporaries of each chunk are bounded: the array
+        returned holds all N systems, so very large populations should be
+        consumed with iterPopulation instead.
+
+        Required Arguments:
+        -------------------
+        isochrone        ::  isochrone object (loaded if not already).
+
+        N                ::  number of systems to draw.
+
+        Optional Arguments:
+        -------------------
+        imf              ::  name of IMF in population.imfs or a callable
+                             returning dN/dM for an array of masses.
+
+        binary_fraction  ::  fraction of systems that are binaries.
+
+        q_dist           ::  mass ratio distribution, 'uniform' or the
+                             power law index gamma of dN/dq ~ q**gamma.
+
+        q_min            ::  minimum mass ratio.
+
+        phot_errors      ::  dictionary of photometric uncertainties keyed
+                             by magnitude column (e.g., {'Mv': 0.02}).
+                             Values may be floats or callables that return
+                             the uncertainty as a function of magnitude.
+
+        chunk_size       ::  number of systems generated at once.
+
+        seed             ::  seed for the random number generator.
+
+        Returns:
+        --------
+        stars            ::  structured array with one row per system. Fields
+                             are 'mass2' and 'binary' in addition to each
+                             isochrone column. Magnitudes with errors applied
+                             have an accompanying 'e_' field.
+
+    """
+    stars = np.empty(N, dtype = populationFields(isochrone, phot_errors))
+    start = 0
+    for chunk in iterPopulation(isochrone, N, imf = imf, binary_fraction = binary_fraction,
+                                q_dist = q_dist, q_min = q_min, phot_errors = phot_errors,
+                                chunk_size = chunk_size, seed = seed):
+        stars[start:start + len(chunk)] = chunk
+        start += len(chunk)
+    return stars
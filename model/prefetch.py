@@ -0,0 +1,96 @@
+#
+#
+import time
+from .manifest import getManifest
+
+__all__ = ['IsochronePrefetcher']
+
+def loadNode(node):
+    """ Create and load the isochrone at an (afe, feh, age, brand) node """
+    from .isochrone import Isochrone
+    afe, feh, age, brand = node
+    iso = Isochrone(age, feh, alpha_enhancement = afe, brand = brand)
+    # runs in worker threads: readers open a file object per call and keep
+    # no module state (unlike fileinput.input), so loads may overlap.
+    # Prefetched isochrones are only read through col(), so they are
+    # loaded lazily.
+    if iso.exists:
+        iso.loadIsochrone(lazy = True)
+    return iso
+
+
+class IsochronePrefetcher(object):
+
+    def __init__(self, brand, nodes = None, depth = 4, threads = 2):
+        """ Read isochrones ahead of their use during a grid scan
+
+            The prefetcher knows the full sequence of (afe, feh, age) nodes
+            that will be visited and keeps up to depth isochrones being read
+            and parsed by a pool of background threads while the caller
+            works on the current one. Iterating over the prefetcher yields
+            isochrone objects in the order of the nodes, loaded lazily (see
+            Isochrone.loadIsochrone) and so to be read through col(). The
+            time the caller spends waiting on an isochrone that is not yet
+            available is accumulated in io_wait.
+
+            Required Arguments:
+            -------------------
+            brand    ::  modeling group.
+
+            Optional Arguments:
+            -------------------
+            nodes    ::  list of (afe, feh, age) nodes to visit. Defaults to
+                         the grid nodes with a file in the brand's manifest.
+
+            depth    ::  number of isochrones read ahead. A depth of 0 loads
+                         each isochrone when requested, without threads.
+
+            threads  ::  number of reader threads.
+
+            Returns:
+            --------
+            IsochronePrefetcher object.
+
+        """
+        if nodes is None:
+            nodes = getManifest(brand).isochroneNodes()
+        self.brand   = brand
+        self.nodes   = [(afe, feh, age, brand) for afe, feh, age in nodes]
+        self.depth   = depth
+        self.threads = max(1, threads)
+        self.io_wait = 0.0
+        self.loaded  = 0
+
+
+    def __len__(self):
+        return len(self.nodes)
+
+
+    def __iter__(self):
+        if self.depth < 1:
+            for node in self.nodes:
+                start = time.time()
+                iso   = loadNode(node)
+                self.io_wait += time.time() - start
+                self.loaded  += 1
+                yield iso
+            return
+
+        from multiprocessing.pool import ThreadPool
+        pool    = ThreadPool(self.threads)
+        pending = [pool.apply_async(loadNode, (node,))
+                   for node in self.nodes[:self.depth]]
+        try:
+            for i in range(len(self.nodes)):
+                # keep the queue full before blocking on the next isochrone
+                if i + self.depth < len(self.nodes):
+                    pending.append(pool.apply_async(loadNode,
+                                                    (self.nodes[i + self.depth],)))
+                start = time.time()
+                iso   = pending.pop(0).get()
+                self.io_wait += time.time() - start
+                self.loaded  += 1
+                yield iso
+        finally:
+            pool.terminate()
+            pool.join()
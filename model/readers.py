@@ -0,0 +1,333 @@
+#
+#
+import time
+import numpy as np
+from . import defs
+from ..utils.compress import openFile, resolvePath
+
+__all__ = ['layouts', 'parseTable', 'readTable', 'readIsochrone', 'formatTable',
+           'binaryPath', 'writeBinary', 'readBinary', 'benchmark', 'checkModelColumns']
+
+# fixed layout of each brand's isochrone files: number of leading header
+# rows without a comment character, and the comment character itself
+layouts = {'BAton'    : {'skip': 0, 'comments': '#'},
+           'Dartmouth': {'skip': 0, 'comments': '#'},
+           'DMESTAR'  : {'skip': 0, 'comments': '#'},
+           'DSEP08'   : {'skip': 0, 'comments': '#'},
+           'Lyon10'   : {'skip': 4, 'comments': '#'},
+           'Lyon19'   : {'skip': 4, 'comments': '#'},
+           'Pisa'     : {'skip': 0, 'comments': '#'},
+           'Yale'     : {'skip': 0, 'comments': '#'}
+          }
+
+
+def readLines(filepath):
+    """ Read all lines of a (possibly compressed) text file, keeping line endings """
+    fin   = openFile(filepath)
+    lines = fin.read().splitlines(True)
+    fin.close()
+    return lines
+
+
+def parseTable(lines, usecols = None, comments = '#', dtype = np.float64, extra = 0):
+    """ Parse lines of a whitespace delimited numerical table into an array
+
+        Comment and blank lines are dropped and the remaining text is
+        parsed in a single pass by numpy's C tokenizer. The requested
+        columns are then copied into a preallocated array of the requested
+        data type. Tables whose rows do not all have the same number of
+        values are passed to np.genfromtxt instead.
+
+        Required Arguments:
+        -------------------
+        lines     ::  list of lines of text.
+
+        Optional Arguments:
+        -------------------
+        usecols   ::  list of column indices to keep. All columns are kept
+                      by default.
+
+        comments  ::  character marking comment lines.
+
+        dtype     ::  data type of the returned array.
+
+        extra     ::  number of uninitialized columns appended to the
+                      array, to be filled later by the caller.
+
+        Returns:
+        --------
+        data      ::  array with one row per table row.
+
+    """
+    lines = [line for line in lines if line.strip() and line.lstrip()[0] != comments]
+    if len(lines) == 0:
+        return np.empty((0, (0 if usecols is None else len(usecols)) + extra), dtype = dtype)
+    N_cols = len(lines[0].split())
+
+    values = np.fromstring(' '.join(lines), sep = ' ')
+    if values.size != N_cols*len(lines):
+        values = np.genfromtxt(lines, comments = comments, usecols = usecols)
+        values = values.reshape(len(values), -1)
+        usecols = None
+    else:
+        values = values.reshape(len(lines), N_cols)
+
+    if usecols is None:
+        if extra == 0 and values.dtype == dtype:
+            return values
+        usecols = range(values.shape[1])
+    return takeColumns(values, usecols, dtype = dtype, extra = extra)
+
+
+def takeColumns(values, usecols, dtype = np.float64, extra = 0):
+    """ Copy columns of an array into a new array with spare columns """
+    data = np.empty((len(values), len(usecols) + extra), dtype = dtype)
+    if dtype == values.dtype and extra == 0:
+        np.take(values, usecols, axis = 1, out = data)
+    else:
+        data[:, :len(usecols)] = np.take(values, usecols, axis = 1)
+    return data
+
+
+def readTable(filepath, usecols = None, skip = 0, comments = '#', dtype = np.float64):
+    """ Read a whitespace delimited numerical table into an array
+
+        Required Arguments:
+        -------------------
+        filepath  ::  location of the table.
+
+        Optional Arguments:
+        -------------------
+        usecols   ::  list of column indices to keep.
+
+        skip      ::  number of leading rows to skip.
+
+        comments  ::  character marking comment lines.
+
+        dtype     ::  data type of the returned array.
+
+        Returns:
+        --------
+        data      ::  array with one row per table row.
+
+    """
+    return parseTable(readLines(filepath)[skip:], usecols = usecols,
+                      comments = comments, dtype = dtype)
+
+
+def formatTable(data, fmt = '%10.6f', block = 10000):
+    """ Format a numerical array as text, one line per row
+
+        Rows are formatted in blocks with a single string formatting
+        operation per block, rather than one call per row. The output is
+        identical to np.savetxt(fmt = fmt).
+
+        Required Arguments:
+        -------------------
+        data   ::  two-dimensional array.
+
+        Optional Arguments:
+        -------------------
+        fmt    ::  format of a single value.
+
+        block  ::  number of rows formatted at once.
+
+        Returns:
+        --------
+        text   ::  formatted table.
+
+    """
+    data = np.asarray(data)
+    if data.ndim == 1:
+        data = data.reshape(-1, 1)
+    row  = ' '.join([fmt]*data.shape[1]) + '\n'
+    text = []
+    for start in range(0, len(data), block):
+        chunk = data[start:start + block]
+        text.append((row*len(chunk)) % tuple(chunk.ravel()))
+    return ''.join(text)
+
+
+def binaryPath(filepath):
+    """ Location of the binary sibling of a model file """
+    return filepath + '.npz'
+
+
+def writeBinary(filepath, data, header = []):
+    """ Write model data and header to a binary sibling file """
+    fout = open(filepath, 'wb')
+    np.savez(fout, data = data, header = np.array(header))
+    fout.close()
+
+
+def readBinary(filepath):
+    """ Read model data and header from a binary sibling of a model file
+
+        The binary file is used only if it is at least as new as the text
+        file (or its compressed variant). Returns None otherwise.
+    """
+    import os
+    text = resolvePath(filepath)
+    try:
+        if text is not None and os.path.getmtime(binaryPath(filepath)) < os.path.getmtime(text):
+            return None
+        cache  = np.load(binaryPath(filepath))
+        data   = cache['data']
+        header = [str(line) for line in cache['header']]
+        cache.close()
+    except (IOError, OSError):
+        return None
+    return data, header
+
+
+def readIsochrone(isochrone, extra = 0):
+    """ Read the columns listed in defs.iso_column from an isochrone file
+
+        The file is read once and both the header and the numerical data
+        are taken from the same pass. If an up to date binary sibling
+        written by writeIsochrone() exists, it is read instead. Data are
+        returned in the storage data type set in defs. Listed columns
+        beyond the end of the file, such as the magnitudes of isochrones
+        not yet transformed, are left out.
+
+        Required Arguments:
+        -------------------
+        isochrone  ::  isochrone object.
+
+        Optional Arguments:
+        -------------------
+        extra      ::  number of uninitialized columns appended to the
+                       data for quantities derived after reading.
+
+        Returns:
+        --------
+        data       ::  array holding only the named columns, followed by
+                       the extra columns.
+
+        column     ::  column dictionary for the returned array, naming
+                       only the columns found in the file.
+
+        header     ::  list of header lines.
+
+    """
+    layout  = layouts.get(isochrone.brand, {'skip': isochrone.comm_rows,
+                                            'comments': '#'})
+    names   = defs.getIsochroneCols(isochrone.brand)
+    dtype   = np.dtype(defs.getStorageDtype())
+
+    binary  = readBinary(isochrone.filepath)
+    if binary is not None:
+        values, header = binary
+    else:
+        lines   = readLines(isochrone.filepath)
+        if layout['skip'] == 0:
+            header = [line for line in lines if line[0] == layout['comments']]
+        else:
+            header = []
+        values  = parseTable(lines[layout['skip']:], comments = layout['comments'])
+
+    if len(values) > 0:
+        names = dict((name, i) for name, i in names.items() if i < values.shape[1])
+    else:
+        values = np.empty((0, max(names.values()) + 1))
+    usecols = sorted(set(names.values()))
+    data    = takeColumns(values, usecols, dtype = dtype, extra = extra)
+    column  = dict((name, usecols.index(i)) for name, i in names.items())
+    return data, column, header
+
+
+def benchmark(brands = None, N_files = 10, repeat = 3):
+    """ Time the fast isochrone readers against np.genfromtxt
+
+        For each brand, up to N_files isochrones listed in the brand's
+        manifest are read with both methods and the best of repeat
+        trials is reported.
+
+        Optional Arguments:
+        -------------------
+        brands   ::  list of brands to test. Defaults to all brands in
+                     readers.layouts with a model directory defined.
+
+        N_files  ::  number of isochrone files per brand.
+
+        repeat   ::  number of timing trials.
+
+        Returns:
+        --------
+        results  ::  dictionary of (genfromtxt time, fast time, speedup)
+                     per brand, with times in seconds per file.
+
+    """
+    from .isochrone import Isochrone
+    from .manifest import getManifest
+
+    if brands is None:
+        brands = [b for b in sorted(layouts) if defs.getModelDirectory(b)]
+
+    results = {}
+    print '{:>10s}{:>8s}{:>14s}{:>14s}{:>10s}'.format('brand', 'files', 'genfromtxt',
+                                                      'fast', 'speedup')
+    for brand in brands:
+        nodes = getManifest(brand).isochroneNodes()[:N_files]
+        isos  = [Isochrone(age, feh, alpha_enhancement = afe, brand = brand)
+                 for afe, feh, age in nodes]
+        if len(isos) == 0:
+            continue
+        skip  = layouts[brand]['skip']
+
+        t_slow, t_fast = [], []
+        for k in range(repeat):
+            start = time.time()
+            for iso in isos:
+                np.genfromtxt(openFile(iso.filepath), comments = '#', skip_header = skip)
+            t_slow.append((time.time() - start)/len(isos))
+
+            start = time.time()
+            for iso in isos:
+                readIsochrone(iso)
+            t_fast.append((time.time() - start)/len(isos))
+
+        results[brand] = (min(t_slow), min(t_fast), min(t_slow)/min(t_fast))
+        print '{:>10s}{:8d}{:14.3e}{:14.3e}{:10.1f}'.format(brand, len(isos),
+                                                            *results[brand])
+    return results
+
+
+def checkModelColumns():
+    """ Check that isochrones without magnitude columns can be read
+
+        A Dartmouth isochrone holding only the model columns, as written
+        for generated isochrones before they are transformed, is written
+        to a temporary directory and read back with readIsochrone.
+
+        Returns:
+        --------
+        True if the isochrone was read with its model columns only.
+
+    """
+    import os
+    import shutil
+    import tempfile
+    from .isochrone import Isochrone
+
+    masses = np.linspace(0.1, 0.9, 20)
+    model  = np.column_stack((np.arange(len(masses)), masses, 5.0 - masses,
+                              np.log10(3000. + 3000.*masses), 2.*np.log10(masses),
+                              np.log10(masses)))
+    directory = tempfile.mkdtemp()
+    iso = Isochrone(1.e9, 0.0, brand = 'Dartmouth')
+    iso.filepath = os.path.join(directory, 'model_only.iso')
+    fout = open(iso.filepath, 'w')
+    fout.write('# model columns only\n' + formatTable(model, fmt = '%10.6f'))
+    fout.close()
+    try:
+        data, column, header = readIsochrone(iso, extra = 1)
+    except IndexError:
+        data, column, header = None, {}, []
+    shutil.rmtree(directory, ignore_errors = True)
+
+    names  = sorted(name for name, i in defs.getIsochroneCols('Dartmouth').items() if i < 6)
+    passed = data is not None and sorted(column) == names and data.shape == (20, 7) and \
+             np.allclose(data[:, column['mass']], masses, atol = 1.e-6)
+    print '{:<14s}{}'.format('model only', 'ok' if passed else 'FAILED')
+    return passed
@@ -0,0 +1,147 @@
+#
+#
+import os
+import numpy as np
+
+__all__ = ['GridDescriptor', 'hostGrid', 'gridKey']
+
+def gridKey(age, feh, afe):
+    """ Hashable key for an isochrone grid node, robust to float round-off """
+    return (round(age, 0), round(feh, 4), round(afe, 4))
+
+
+class GridDescriptor(object):
+
+    def __init__(self, brand, filepath, dtype, columns, nodes):
+        """ Picklable description of an isochrone grid held in a shared file
+
+            The descriptor records where each isochrone lives in a flat
+            binary file created by hostGrid(). It is small enough to be
+            sent to every worker process. Workers map the file read-only
+            and hand out views into it, so the operating system keeps a
+            single copy of the grid in memory regardless of the number of
+            processes attached.
+
+            Required Arguments:
+            -------------------
+            brand     ::  modeling group of the hosted isochrones.
+
+            filepath  ::  location of the flat binary grid file.
+
+            dtype     ::  numpy data type of the stored values.
+
+            columns   ::  column dictionary shared by all isochrones.
+
+            nodes     ::  dictionary mapping gridKey(age, feh, afe) to the
+                          (offset, rows, columns) of each isochrone.
+
+            Returns:
+            --------
+            GridDescriptor object.
+
+        """
+        self.brand    = brand
+        self.filepath = filepath
+        self.dtype    = np.dtype(dtype).str
+        self.columns  = columns
+        self.nodes    = nodes
+        self.buffer   = None
+
+
+    def __getstate__(self):
+        """ Send everything except the process-local memory map """
+        state = self.__dict__.copy()
+        state['buffer'] = None
+        return state
+
+
+    def hasNode(self, age, feh, afe = 0.0):
+        """ Check whether an isochrone is held in the shared grid """
+        return gridKey(age, feh, afe) in self.nodes
+
+
+    def attach(self, age, feh, afe = 0.0):
+        """ Return a read-only, zero-copy view of one isochrone array """
+        if self.buffer is None:
+            self.buffer = np.memmap(self.filepath, dtype = self.dtype, mode = 'r')
+        offset, rows, cols = self.nodes[gridKey(age, feh, afe)]
+        return self.buffer[offset:offset + rows*cols].reshape(rows, cols)
+
+
+    def isochrone(self, age, feh, afe = 0.0):
+        """ Create an isochrone object attached to the shared grid """
+        from .isochrone import Isochrone
+        iso = Isochrone(age, feh, alpha_enhancement = afe, brand = self.brand)
+        iso.attachShared(self)
+        return iso
+
+
+    def release(self):
+        """ Remove the shared grid file (call from the hosting process) """
+        self.buffer = None
+        try:
+            os.remove(self.filepath)
+        except OSError:
+            pass
+
+
+def hostGrid(brand, filepath = None, directory = None, dtype = None):
+    """ Load all isochrones of a model brand into one shared grid file
+
+        Isochrones are loaded one at a time and appended to a flat binary
+        file, so the hosting process never holds more than one isochrone in
+        memory. Placing the file on a memory-backed filesystem (e.g.,
+        directory = '/dev/shm') keeps the grid entirely in RAM.
+
+        Required Arguments:
+        -------------------
+        brand      ::  modeling group.
+
+        Optional Arguments:
+        -------------------
+        filepath   ::  location of the grid file. A temporary file is created
+                       when not given.
+
+        directory  ::  directory for the temporary grid file.
+
+        dtype      ::  numpy data type used to store the isochrones.
+                       Defaults to the storage type set in defs.
+
+        Returns:
+        --------
+        descriptor ::  GridDescriptor object to be passed to workers.
+
+    """
+    import tempfile
+    from .isochrone import Isochrone
+    from .defs import getStorageDtype
+    from .manifest import getManifest
+
+    if dtype is None:
+        dtype = getStorageDtype()
+
+    if filepath is None:
+        handle, filepath = tempfile.mkstemp(suffix = '.grid', dir = directory)
+        os.close(handle)
+
+    nodes   = {}
+    columns = None
+    offset  = 0
+    fout = open(filepath, 'wb')
+    for afe, feh, age in getManifest(brand).isochroneNodes():
+        iso = Isochrone(age, feh, alpha_enhancement = afe, brand = brand)
+        if not iso.exists:
+            continue
+        iso.loadIsochrone()
+        if not iso.is_loaded:
+            continue
+        if columns is None:
+            columns = dict(iso.column)
+
+        data = np.ascontiguousarray(iso.isochrone, dtype = dtype)
+        data.tofile(fout)
+        nodes[gridKey(age, feh, afe)] = (offset, data.shape[0], data.shape[1])
+        offset += data.size
+    fout.close()
+
+    return GridDescriptor(brand, filepath, dtype, columns, nodes)
@@ -1,15 +1,22 @@
 #
 #
 from . import binary
+from ..utils.dtype import checkTuple
 
 class Triple(object):
-    
+
     def __init__(self, binary, tertiary, outer_period):
         """ Combine single star and binary to create triple. """
-        self.addTertiary(tertiary, outer_period)
+        self.inner = binary
+        self.stars = binary.stars + [tertiary]
+        self.outer_period = checkTuple(outer_period)
+        self.N_components = binary.N_components + tertiary.N_components
 
 class Quadruple(object):
-    
+
     def __init__(self, binary1, binary2, period):
         """ Construct quadruple system from two binaries. """
-        pass
+        self.binaries = [binary1, binary2]
+        self.stars  = binary1.stars + binary2.stars
+        self.period = checkTuple(period)
+        self.N_components = binary1.N_components + binary2.N_components
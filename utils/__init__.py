@@ -2,4 +2,4 @@
 #
 from . import *
 
-__all__ = ['dtype']
+__all__ = ['dtype', 'compress', 'progress']
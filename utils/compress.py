@@ -0,0 +1,146 @@
+#
+#
+import os
+import gzip
+import bz2
+
+try:
+    import lzma
+except ImportError:
+    try:
+        from backports import lzma
+    except ImportError:
+        lzma = None
+
+__all__ = ['suffixes', 'resolvePath', 'openFile', 'compressFile', 'recompressTree']
+
+# compressed file suffixes, in the order they are searched
+suffixes = ['.gz', '.bz2', '.xz']
+
+# files that are never recompressed (already compressed, binary caches, or
+# metadata of model cubes and HR tables)
+skip_suffixes = suffixes + ['.npz', '.npy', '.grid', '.tmp', '.json']
+
+
+def openCompressed(filepath, mode = 'rb'):
+    """ Open file with the decompressor matching its suffix """
+    if filepath.endswith('.gz'):
+        return gzip.open(filepath, mode)
+    elif filepath.endswith('.bz2'):
+        return bz2.BZ2File(filepath, mode)
+    elif filepath.endswith('.xz'):
+        if lzma is None:
+            raise IOError('lzma module required to read {0}'.format(filepath))
+        return lzma.open(filepath, mode)
+    else:
+        return open(filepath, mode)
+
+
+def resolvePath(filepath):
+    """ Locate a file or its compressed variant (.gz, .bz2, .xz)
+
+        Required Arguments:
+        -------------------
+        filepath  ::  location of the uncompressed file.
+
+        Returns:
+        --------
+        path      ::  location of the file that exists, or None.
+
+    """
+    if os.path.isfile(filepath):
+        return filepath
+    for suffix in suffixes:
+        if os.path.isfile(filepath + suffix):
+            return filepath + suffix
+    return None
+
+
+def openFile(filepath):
+    """ Open a file for reading, transparently decompressing it
+
+        The uncompressed file is used if it exists, otherwise the first
+        compressed variant found is opened with a streaming decompressor.
+    """
+    path = resolvePath(filepath)
+    if path is None:
+        raise IOError('File {0} not found.'.format(filepath))
+    return openCompressed(path)
+
+
+def compressFile(args):
+    """ Compress a single file, replacing the original
+
+        The compressed file is written under a temporary name and renamed
+        once complete, so readers never see a partial file. The original
+        modification time is kept.
+
+        Required Arguments:
+        -------------------
+        args  ::  tuple of (file path, suffix, remove original).
+
+        Returns:
+        --------
+        (uncompressed size, compressed size) in bytes.
+
+    """
+    import shutil
+    filepath, suffix, remove = args
+    target = filepath + suffix
+
+    fin  = open(filepath, 'rb')
+    fout = openCompressed(target + '.tmp' + suffix, 'wb')
+    shutil.copyfileobj(fin, fout, 1 << 20)
+    fout.close()
+    fin.close()
+
+    os.rename(target + '.tmp' + suffix, target)
+    stat = os.stat(filepath)
+    os.utime(target, (stat.st_atime, stat.st_mtime))
+    if remove:
+        os.remove(filepath)
+    return stat.st_size, os.path.getsize(target)
+
+
+def recompressTree(root, suffix = '.gz', processes = None, remove = True):
+    """ Compress every model file below a directory in parallel
+
+        Hidden files and files with a suffix in skip_suffixes are left as
+        they are.
+
+        Required Arguments:
+        -------------------
+        root       ::  top of the model directory tree.
+
+        Optional Arguments:
+        -------------------
+        suffix     ::  compression format, one of '.gz', '.bz2', or '.xz'.
+
+        processes  ::  number of worker processes (defaults to all cores).
+
+        remove     ::  remove uncompressed files once compressed.
+
+        Returns:
+        --------
+        (uncompressed size, compressed size) of the tree in bytes.
+
+    """
+    from multiprocessing import Pool
+
+    if suffix not in suffixes:
+        print 'ERROR: Compression format must be one of {0}.\n'.format(suffixes)
+        return None
+
+    tasks = []
+    for path, dirnames, filenames in os.walk(root):
+        for name in filenames:
+            if name[0] == '.' or os.path.splitext(name)[1] in skip_suffixes:
+                continue
+            tasks.append((os.path.join(path, name), suffix, remove))
+
+    pool  = Pool(processes)
+    sizes = pool.map(compressFile, tasks)
+    pool.close()
+    pool.join()
+
+    return sum(s[0] for s in sizes), sum(s[1] for s in sizes)
@@ -0,0 +1,101 @@
+#
+#
+import time
+
+__all__ = ['Progress', 'printProgress']
+
+
+class Progress(object):
+
+    def __init__(self, callback, task, total = None, unit = 'isochrones', interval = 0.,
+                 rates = {}):
+        """ Report the progress of a long-running job to a callback
+
+            The callback is called with a dictionary describing each event:
+
+              task     ::  name of the job, e.g. 'bestFit'.
+              event    ::  'start', 'progress' or 'finish'.
+              done     ::  number of units processed so far.
+              total    ::  number of units to process (None if unknown).
+              unit     ::  what is being counted, e.g. 'isochrones', 'stars'.
+              elapsed  ::  time since the start of the job (s).
+              rate     ::  units processed per second.
+
+            along with '<name>_per_second' for every entry of rates and any
+            job-specific metrics (I/O wait, cache hits, ...).
+            A callback may block to throttle the job. Nothing is done when
+            the callback is None.
+
+            Required Arguments:
+            -------------------
+            callback  ::  callable taking an event dictionary, or None.
+
+            task      ::  name of the job.
+
+            Optional Arguments:
+            -------------------
+            total     ::  number of units in the job.
+
+            unit      ::  name of the units counted.
+
+            interval  ::  minimum time (s) between progress events.
+
+            rates     ::  dictionary of other quantities processed with each
+                          unit, e.g. {'stars': 1000} when 1000 stars are fit
+                          against every isochrone.
+
+            Returns:
+            --------
+            Progress object.
+
+        """
+        self.callback = callback
+        self.task     = task
+        self.total    = total
+        self.unit     = unit
+        self.interval = interval
+        self.rates    = rates
+        self.done     = 0
+        self.start_time = time.time()
+        self.last_emit  = 0.
+
+
+    def emit(self, event, **metrics):
+        """ Send an event with the current counts and the given metrics """
+        if self.callback is None:
+            return
+        now     = time.time()
+        elapsed = now - self.start_time
+        info = {'task': self.task, 'event': event, 'done': self.done, 'total': self.total,
+                'unit': self.unit, 'elapsed': elapsed,
+                'rate': self.done/elapsed if elapsed > 0. else 0.}
+        for name, per_unit in self.rates.items():
+            info[name + '_per_second'] = per_unit*info['rate']
+        info.update(metrics)
+        self.last_emit = now
+        self.callback(info)
+
+
+    def start(self, **metrics):
+        """ Signal the start of the job """
+        self.start_time = time.time()
+        self.emit('start', **metrics)
+
+
+    def update(self, n = 1, **metrics):
+        """ Count n more units done, and report if the interval has passed """
+        self.done += n
+        if self.callback is not None and time.time() - self.last_emit >= self.interval:
+            self.emit('progress', **metrics)
+
+
+    def finish(self, **metrics):
+        """ Signal the end of the job """
+        self.emit('finish', **metrics)
+
+
+def printProgress(event):
+    """ Callback printing one line per event """
+    total = '' if event['total'] is None else '/{0}'.format(event['total'])
+    print '{0}: {1} {2}{3} {4} ({5:.1f} {4}/s)'.format(event['task'], event['event'],
+          event['done'], total, event['unit'], event['rate'])